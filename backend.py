@@ -0,0 +1,16 @@
+# picks the console backend the game draws with and reads input from: the libtcod library,
+# or the pure python in-memory console in headless.py (no display or libtcod shared library needed).
+# set the ROGUELIKE_BACKEND environment variable to 'headless' to use the latter.
+# game modules import the chosen one with "from backend import libtcod".
+import os
+
+BACKEND = os.environ.get('ROGUELIKE_BACKEND', 'libtcod')
+
+if BACKEND == 'libtcod':
+    import libtcodpy as libtcod
+elif BACKEND == 'headless':
+    import headless as libtcod
+else:
+    raise ImportError('Unknown ROGUELIKE_BACKEND: ' + repr(BACKEND))
+
+HEADLESS = BACKEND == 'headless'
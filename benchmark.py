@@ -0,0 +1,285 @@
+# benchmarks for the hot parts of the game, run against the headless backend:
+# level generation, FOV, the monster phase (also with a swarm of orcs), rendering and saving/loading. usage:
+#   python benchmark.py [--repeat N] [--seeds S1,S2,..] [--levels L1,L2,..] [--json FILE] [--baseline FILE] [--tolerance PCT]
+# results are printed as a table and, with --json, written as JSON. with --baseline they're compared against
+# a previous --json file, and the exit status is 1 if anything got slower than the tolerance allows.
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import timeit
+
+os.environ.setdefault('ROGUELIKE_BACKEND', 'headless')
+
+from backend import libtcod, BACKEND
+from constants import ROOM_MAX_SIZE, TORCH_RADIUS, FOV_LIGHT_WALLS, FOV_ALGO, TURN_TIME, ACTIVATION_RADIUS
+from dynamics import build_monster
+from levelmap import Rect
+from scheduler import Scheduler
+import roguelike
+
+clock = timeit.default_timer
+
+
+def measure(func, repeat, setup=None):
+    # call func repeat times (after setup, which isn't timed) and return the timings in milliseconds
+    times = []
+    for i in range(repeat):
+        if setup is not None:
+            setup()
+        start = clock()
+        func()
+        times.append((clock() - start) * 1000.0)
+    return times
+
+
+def summarize(times):
+    times = sorted(times)
+    return {
+        'runs': len(times),
+        'mean_ms': sum(times) / len(times),
+        'median_ms': times[len(times) // 2],
+        'min_ms': times[0],
+        'max_ms': times[-1],
+    }
+
+
+def seed(n):
+    if hasattr(libtcod, 'random_set_seed'):
+        libtcod.random_set_seed(n)
+
+
+def start_game(n, level=1):
+    # a fresh game on the given dungeon level, with the FOV computed and drawn once
+    seed(n)
+    roguelike.new_game()
+    if level != 1:
+        roguelike.dungeon_level = level
+        roguelike.make_map()
+        roguelike.initialize_fov()
+    roguelike.render_all()
+
+
+def bench_make_map(repeat, seeds, levels):
+    results = {}
+    for level in levels:
+        times = []
+        for n in seeds:
+            start_game(n)
+            roguelike.dungeon_level = level
+            times.extend(measure(roguelike.make_map, repeat))
+        results['make_map/level%d' % level] = summarize(times)
+    return results
+
+
+def bench_place_objects(repeat, seeds, levels):
+    # fill one big empty room over and over
+    results = {}
+    room = Rect(1, 1, ROOM_MAX_SIZE, ROOM_MAX_SIZE)
+    for level in levels:
+        times = []
+        for n in seeds:
+            start_game(n)
+            roguelike.dungeon_level = level
+            roguelike.level_map.carve_room(room)
+            player_and_stairs = list(roguelike.objects)
+
+            def reset():
+                # a fresh level each time, like make_map, so neither the objects nor the turn order pile up
+                roguelike.objects = roguelike.ObjectList(player_and_stairs)
+                roguelike.actors = Scheduler(TURN_TIME, ACTIVATION_RADIUS)
+            times.extend(measure(lambda: roguelike.place_objects(room), repeat * 10, reset))
+        results['place_objects/level%d' % level] = summarize(times)
+    return results
+
+
+def bench_fov(repeat, seeds):
+    # the FOV engine itself (bypassing the cache), from every floor tile of the level in turn
+    times = []
+    for n in seeds:
+        start_game(n)
+        fov_map = roguelike.fov_map
+        level_map = roguelike.level_map
+        floor = [(i % level_map.width, i // level_map.width)
+            for i in range(level_map.width * level_map.height) if not level_map.blocked[i]]
+        step = max(1, len(floor) // (repeat * 10))
+        for (x, y) in floor[::step]:
+            times.extend(measure(lambda: fov_map.compute_uncached(x, y, TORCH_RADIUS, FOV_LIGHT_WALLS, FOV_ALGO), 1))
+    return {'fov/compute': summarize(times)}
+
+
+def bench_monster_phase(repeat, seeds, levels):
+    results = {}
+    for level in levels:
+        times = []
+        for n in seeds:
+            start_game(n, level)
+            times.extend(measure(roguelike.take_monster_turns, repeat * 10))
+        results['monster_phase/level%d' % level] = summarize(times)
+    return results
+
+
+def make_swarm(n):
+    # a level that is one big open room, with the player in the middle and an orc on every other tile,
+    # except around the player's row, which is left free to walk along
+    start_game(n)
+    level_map = roguelike.level_map
+    level_map.carve_room(Rect(0, 0, level_map.width - 1, level_map.height - 1))
+    player = roguelike.player
+    roguelike.objects = roguelike.ObjectList([player])
+    roguelike.actors = Scheduler(TURN_TIME, ACTIVATION_RADIUS)
+    roguelike.objects.place(player, level_map.width // 2, level_map.height // 2)
+    for y in range(1, level_map.height - 1, 2):
+        for x in range(1, level_map.width - 1, 2):
+            if abs(y - player.y) > 1 and not roguelike.is_blocked(x, y):
+                symbol, colour, fighter_component, ai_component = build_monster('orc')
+                orc = roguelike.GameObject(x, y, symbol, 'orc', colour, blocks=True, fighter=fighter_component, ai=ai_component)
+                roguelike.objects.append(orc)
+                roguelike.actors.add(orc)
+    roguelike.initialize_fov()
+    roguelike.render_all()
+
+
+def bench_swarm(repeat, seeds):
+    # the first monster phase with hundreds of orcs closing in
+    times = []
+    for n in seeds:
+        times.extend(measure(roguelike.take_monster_turns, repeat, lambda: make_swarm(n)))
+    return {'monster_phase/swarm': summarize(times)}
+
+
+def bench_render_all(repeat, seeds):
+    # a full frame, with the FOV recomputed like after a step of the player
+    times = []
+    for n in seeds:
+        start_game(n)
+
+        def moved():
+            roguelike.fov_recompute = True
+        times.extend(measure(roguelike.render_all, repeat * 5, moved))
+    return {'render_all': summarize(times)}
+
+
+def bench_render_objects(repeat, seeds):
+    # drawing the objects of a crowded level, on frames where nothing changed and after a step of the player
+    idle = []
+    moving = []
+    for n in seeds:
+        make_swarm(n)
+        idle.extend(measure(roguelike.render_objects, repeat * 5))
+        steps = [1, -1]
+
+        def step():
+            steps.reverse()
+            roguelike.player_move_or_attack(steps[0], 0)
+            roguelike.update_fov()
+        moving.extend(measure(roguelike.render_objects, repeat * 5, step))
+    return {'render_objects/idle': summarize(idle), 'render_objects/moving': summarize(moving)}
+
+
+def bench_save_load(repeat, seeds):
+    # save_game() and load_game() write to the working directory, so run them in a scratch one
+    results = {}
+    cwd = os.getcwd()
+    scratch = tempfile.mkdtemp()
+    try:
+        os.chdir(scratch)
+        save_times = []
+        load_times = []
+        for n in seeds:
+            start_game(n)
+            save_times.extend(measure(roguelike.save_game, repeat))
+            load_times.extend(measure(roguelike.load_game, repeat))
+        results['save_game'] = summarize(save_times)
+        results['load_game'] = summarize(load_times)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(scratch)
+    return results
+
+
+def run(repeat=5, seeds=(1, 2, 3), levels=(1, 4, 7)):
+    # run every benchmark, returns the results as a JSON-friendly dict
+    roguelike.init_root()
+    roguelike.rendering = True
+    roguelike.mouse = libtcod.Mouse()
+    roguelike.key = libtcod.Key()
+
+    results = {}
+    results.update(bench_make_map(repeat, seeds, levels))
+    results.update(bench_place_objects(repeat, seeds, levels))
+    results.update(bench_fov(repeat, seeds))
+    results.update(bench_monster_phase(repeat, seeds, levels))
+    results.update(bench_swarm(repeat, seeds))
+    results.update(bench_render_all(repeat, seeds))
+    results.update(bench_render_objects(repeat, seeds))
+    results.update(bench_save_load(repeat, seeds))
+    return {
+        'python': platform.python_version(),
+        'backend': BACKEND,
+        'numpy': roguelike.numpy is not None,
+        'repeat': repeat,
+        'seeds': list(seeds),
+        'levels': list(levels),
+        'results': results,
+    }
+
+
+def compare(report, baseline, tolerance):
+    # print the change against the baseline for every benchmark, returns the names that got too slow
+    slower = []
+    print('%-28s %12s %12s %8s' % ('benchmark', 'baseline ms', 'now ms', 'change'))
+    for name in sorted(report['results']):
+        now = report['results'][name]['median_ms']
+        if name not in baseline['results']:
+            print('%-28s %12s %12.3f %8s' % (name, '-', now, 'new'))
+            continue
+        before = baseline['results'][name]['median_ms']
+        change = (now - before) / before * 100.0 if before > 0 else 0.0
+        print('%-28s %12.3f %12.3f %+7.1f%%' % (name, before, now, change))
+        if change > tolerance:
+            slower.append(name)
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark level generation, FOV, AI, rendering and save/load.')
+    parser.add_argument('--repeat', type=int, default=5, help='repetitions per benchmark and seed (default 5)')
+    parser.add_argument('--seeds', default='1,2,3', help='comma separated dungeon seeds (default 1,2,3)')
+    parser.add_argument('--levels', default='1,4,7', help='comma separated dungeon levels (default 1,4,7)')
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--baseline', help='compare against results previously written with --json')
+    parser.add_argument('--tolerance', type=float, default=10.0,
+        help='percentage a median may grow over the baseline before it counts as slower (default 10)')
+    args = parser.parse_args(argv)
+
+    seeds = [int(s) for s in args.seeds.split(',')]
+    levels = [int(l) for l in args.levels.split(',')]
+    report = run(args.repeat, seeds, levels)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        slower = compare(report, baseline, args.tolerance)
+        if slower:
+            print('slower than the baseline: ' + ', '.join(slower))
+            return 1
+    else:
+        print('%-28s %10s %10s %10s' % ('benchmark', 'median ms', 'min ms', 'max ms'))
+        for name in sorted(report['results']):
+            r = report['results'][name]
+            print('%-28s %10.3f %10.3f %10.3f' % (name, r['median_ms'], r['min_ms'], r['max_ms']))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
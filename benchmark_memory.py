@@ -0,0 +1,130 @@
+# memory taken by the game's entities: spawns N monsters and N items the way place_objects does, and reports
+# the bytes per entity, both as counted object by object (the GameObject, its components and their instance
+# dicts) and as the growth of the whole process. with --compare, the same entities are also measured as
+# dict-backed copies (the classes without their __slots__, as they were before), and the saving is printed.
+# usage:
+#   python benchmark_memory.py [--count N] [--compare]
+from __future__ import print_function
+
+import argparse
+import gc
+import os
+import sys
+
+os.environ.setdefault('ROGUELIKE_BACKEND', 'headless')
+
+from dynamics import build_monster
+from statics import make_item
+import roguelike
+
+# objects of these modules belong to the entity that references them (components), anything else is shared
+OWN_MODULES = ('roguelike', 'dynamics', 'statics', 'levelmap', __name__)
+
+# the components of an entity, which point back to it through their owner
+COMPONENTS = ('fighter', 'ai', 'item', 'equipment')
+
+
+def footprint(obj):
+    # bytes of obj, of its instance dict if it has one, and of the components it owns, recursively
+    seen = set()
+    stack = [obj]
+    total = 0
+    while stack:
+        o = stack.pop()
+        if id(o) in seen:
+            continue
+        seen.add(id(o))
+        total += sys.getsizeof(o)
+        for r in gc.get_referents(o):
+            if type(r) is dict or type(r).__module__ in OWN_MODULES:
+                stack.append(r)
+    return total
+
+
+def rss():
+    # resident size of the process in bytes, or None where /proc isn't available
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def slot_names(cls):
+    return [name for c in cls.__mro__ for name in c.__dict__.get('__slots__', ())
+        if name not in ('__dict__', '__weakref__')]
+
+
+DICT_BACKED = {}  # slotted class -> the same class without __slots__
+
+
+def dict_backed_class(cls):
+    if cls not in DICT_BACKED:
+        names = set(slot_names(cls)) | set(['__slots__', '__dict__', '__weakref__'])
+        attrs = dict((k, v) for k, v in vars(cls).items() if k not in names)
+        attrs['__module__'] = __name__
+        DICT_BACKED[cls] = type(cls.__name__, cls.__bases__, attrs)
+    return DICT_BACKED[cls]
+
+
+def dict_backed(obj, owner=None):
+    # a copy of obj, and of its components, whose attributes live in an instance dict
+    if not slot_names(type(obj)):
+        return obj
+    copy = dict_backed_class(type(obj)).__new__(dict_backed_class(type(obj)))
+    for name in slot_names(type(obj)):
+        if hasattr(obj, name):
+            value = getattr(obj, name)
+            if name == 'owner':
+                value = owner
+            elif name in COMPONENTS and value is not None:
+                value = dict_backed(value, copy)
+            copy.__dict__[name] = value
+    copy.__dict__.update(getattr(obj, '__dict__', {}))
+    return copy
+
+
+def spawn_monster(i):
+    symbol, colour, fighter_component, ai_component = build_monster('orc' if i % 4 else 'troll')
+    return roguelike.GameObject(i % 80, i // 80, symbol, 'orc', colour, blocks=True, fighter=fighter_component, ai=ai_component)
+
+
+def spawn_item(i):
+    symbol, name, colour, item_component, equipment_component = make_item('heal' if i % 4 else 'sword')
+    return roguelike.GameObject(i % 80, i // 80, symbol, name, colour, item=item_component, equipment=equipment_component)
+
+
+def measure(spawn, count, keep):
+    # spawn count entities, which are added to keep so that the memory they take isn't reused afterwards
+    gc.collect()
+    before = rss()
+    entities = [spawn(i) for i in range(count)]
+    after = rss()
+    keep.extend(entities)
+    counted = sum(footprint(e) for e in entities[:1000]) / 1000.0
+    grown = (after - before) / float(count) if before is not None else float('nan')
+    return {'counted_bytes': counted, 'rss_bytes': grown}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Report the memory taken per monster and per item.')
+    parser.add_argument('--count', type=int, default=100000, help='entities of each kind to spawn (default 100000)')
+    parser.add_argument('--compare', action='store_true',
+        help='also measure dict-backed copies of the entities, the layout before __slots__')
+    args = parser.parse_args(argv)
+
+    print('%-18s %16s %16s' % ('entity', 'counted bytes', 'process bytes'))
+    keep = []
+    for name, spawn in (('monster', spawn_monster), ('item', spawn_item)):
+        result = measure(spawn, args.count, keep)
+        print('%-18s %16.0f %16.0f' % (name, result['counted_bytes'], result['rss_bytes']))
+        if args.compare:
+            before = measure(lambda i: dict_backed(spawn(i)), args.count, keep)
+            print('%-18s %16.0f %16.0f' % (name + ' (dicts)', before['counted_bytes'], before['rss_bytes']))
+            print('%-18s %15.0f%% %15.0f%%' % (name + ' saving',
+                100.0 * (1 - result['counted_bytes'] / before['counted_bytes']),
+                100.0 * (1 - result['rss_bytes'] / before['rss_bytes'])))
+
+
+if __name__ == '__main__':
+    main()
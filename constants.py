@@ -1,4 +1,4 @@
-import libtcodpy as libtcod
+from backend import libtcod, HEADLESS
 
 # actual size of the window
 SCREEN_WIDTH = 80
@@ -43,9 +43,30 @@ CHARACTER_SCREEN_WIDTH = 30
 FOV_ALGO = 0  # default FOV algorithm
 FOV_LIGHT_WALLS = True  # light walls or not
 TORCH_RADIUS = 10
+FOV_ENGINE = 'shadowcast' if HEADLESS else 'libtcod'  # 'libtcod' for the native FOV map, 'shadowcast' for the pure python one
+FOV_CACHE_SIZE = 32  # number of recent FOV results kept around, 0 to disable the cache
 
 LIMIT_FPS = 20  # 20 frames-per-second maximum
 
+# render layers of the objects, drawn from the lowest up
+# (corpses aren't objects but decals on the map, drawn below every object)
+LAYER_FEATURE, LAYER_ITEM, LAYER_ACTOR, LAYER_PLAYER = range(4)
+CORPSE_LIFETIME = None  # turns before a corpse rots away, None to keep them for good
+
+SAVE_FILE = 'savegame.sav'  # binary, see savefile.py
+
+TURN_TIME = 100  # game time taken by one action of the player, or of a monster with speed 1
+# monsters that only act on sight are left dormant farther than this from the player. the FOV they check
+# may still be the one from before the player's step, hence the margin. None to keep every monster awake
+ACTIVATION_RADIUS = TORCH_RADIUS + 2 if TORCH_RADIUS > 0 else None
+# how far the noise of a fight and of the loud spells carries: dormant monsters within it wake up
+MELEE_NOISE_RADIUS = 15
+LIGHTNING_NOISE_RADIUS = 20
+FIREBALL_NOISE_RADIUS = 20
+FLOW_FIELD_RANGE = 30  # monsters farther (in steps) from the player than this chase it in a straight line
+PATH_TOLERANCE = 2  # how far a target may move before the path to it is searched again
+BATCH_MIN_MONSTERS = 8  # with numpy, the moves of this many basic monsters or more are worked out all at once
+
 
 color_dark_wall = libtcod.Color(0, 0, 100)
 color_light_wall = libtcod.Color(130, 110, 50)
@@ -1,4 +1,4 @@
-import libtcodpy as libtcod
+from backend import libtcod
 from constants import CONFUSE_NUM_TURNS
 
 
@@ -8,6 +8,11 @@ def do_nothing(*args, **kwargs):
 
 class Fighter(object):
     # combat-related properties and methods (monster, player, NPC).
+    # the bonuses of the equipped items are summed once and kept until something is equipped or dequipped
+    __slots__ = ('owner', 'base_max_hp', 'hp', 'base_max_mp', 'mp', 'base_defense', 'base_power', 'xp',
+        'death_function', 'manaless_function', 'bonus_revision', 'bonus')
+    equipment_revision = 0  # bumped by equipment_changed(), for every fighter at once
+
     def __init__(self, hp, mp, defense, power, xp, death_function=None, manaless_function=None):
         self.base_max_hp = hp
         self.hp = hp
@@ -18,22 +23,37 @@ class Fighter(object):
         self.xp = xp
         self.death_function = death_function or do_nothing
         self.manaless_function = manaless_function or do_nothing
+        self.bonus_revision = None  # the equipment_revision the bonus was summed at
+        self.bonus = (0, 0, 0, 0)  # power, defense, max_hp and max_mp from equipment
+
+    @staticmethod
+    def equipment_changed():
+        # something was equipped or dequipped somewhere: every fighter sums its bonuses again on next use
+        Fighter.equipment_revision += 1
+
+    def bonuses(self): # return the bonuses from all equipped items, summing them up again only if needed
+        if self.bonus_revision != Fighter.equipment_revision:
+            equipped = get_all_equipped(self.owner)
+            self.bonus = (sum(e.power_bonus for e in equipped), sum(e.defense_bonus for e in equipped),
+                sum(e.max_hp_bonus for e in equipped), sum(e.max_mp_bonus for e in equipped))
+            self.bonus_revision = Fighter.equipment_revision
+        return self.bonus
 
     @property
-    def power(self): # return actual power, by summing up the bonuses from all equipped items
-        return self.base_power + sum(e.power_bonus for e in get_all_equipped(self.owner))
+    def power(self): # return actual power, base plus the bonuses from all equipped items
+        return self.base_power + self.bonuses()[0]
 
     @property
-    def defense(self): # return actual defence, by summing up the bonuses from all equipped items
-        return self.base_defense + sum(e.defense_bonus for e in get_all_equipped(self.owner))
+    def defense(self): # return actual defence, base plus the bonuses from all equipped items
+        return self.base_defense + self.bonuses()[1]
 
     @property
-    def max_hp(self): # return actual max_hp, by summing up the bonuses from all equipped items
-        return self.base_max_hp + sum(e.max_hp_bonus for e in get_all_equipped(self.owner))
+    def max_hp(self): # return actual max_hp, base plus the bonuses from all equipped items
+        return self.base_max_hp + self.bonuses()[2]
 
     @property
-    def max_mp(self): # return actual max_hp, by summing up the bonuses from all equipped items
-        return self.base_max_mp + sum(e.max_mp_bonus for e in get_all_equipped(self.owner))
+    def max_mp(self): # return actual max_mp, base plus the bonuses from all equipped items
+        return self.base_max_mp + self.bonuses()[3]
 
     def attack(self, target, message, player):
         # a simple formula for attack damage
@@ -74,21 +94,26 @@ class Fighter(object):
 
 class BasicMonster(object):
     # AI for a basic monster.
+    __slots__ = ('owner',)
+    sleeps_out_of_sight = True  # does nothing unless in FOV, so it can be left dormant far from the player
+
     def take_turn(self, message, fov_map, player):
         # a basic monster takes its turn. if you can see it, it can see you
         monster = self.owner
-        if libtcod.map_is_in_fov(fov_map, monster.x, monster.y):
+        if fov_map.is_in_fov(monster.x, monster.y):
 
             # move towards player if far away
             if monster.distance_to(player) >= 2:
-                monster.move_towards(player.x, player.y)
+                monster.move_towards_player()
 
             # close enough, attack! (if the player is still alive.)
             elif player.fighter.hp > 0:
-                return monster.fighter.attack(player, message, player)
+                return monster.attack(player, message)
 
 class ConfusedMonster(object):
     # AI for a temporarily confused monster (reverts to previous AI after a while).
+    __slots__ = ('owner', 'old_ai', 'num_turns')
+
     def __init__(self, old_ai, num_turns=CONFUSE_NUM_TURNS):
         self.old_ai = old_ai
         self.num_turns = num_turns
@@ -105,15 +130,18 @@ class ConfusedMonster(object):
 
 class BasicNPC(object):
     # AI for a basic npc.
+    __slots__ = ('owner',)
+    sleeps_out_of_sight = True
+
     def take_turn(self, message, fov_map, player):
         # a basic npc takes its turn, it wanders toward the player, if the player can see it.
         npc = self.owner
-        if libtcod.map_is_in_fov(fov_map, npc.x, npc.y):
-            npc.move_towards(player.x, player.y)
+        if fov_map.is_in_fov(npc.x, npc.y):
+            npc.walk_towards(player.x, player.y)
 
 def monster_death(monster, message):
     # transform it into a nasty corpse! it doesn't block, can't be
-    # attacked and doesn't move
+    # attacked and doesn't move; it leaves the objects, to lie on the map as a decal
     message('The %s is dead! You gain %i experience points.'%(monster.name.capitalize(), monster.fighter.xp), libtcod.orange)
     monster.char = '%'
     monster.color = libtcod.dark_red
@@ -121,7 +149,7 @@ def monster_death(monster, message):
     monster.fighter = None
     monster.ai = None
     monster.name = 'remains of ' + monster.name
-    monster.send_to_back()
+    monster.leave_remains()
     return ""
 
 def player_death(player, message):
@@ -137,7 +165,9 @@ def player_manaless(player):
     player.color = libtcod.lightest_grey
 
 def get_all_equipped(obj): # returns a list of equipped items
-    return [item.equipment for item in obj.inventory if item.equipment and item.equipment.is_equipped]
+    if obj.inventory is None:
+        return []
+    return list(obj.inventory.equipped.values())
 
 def build_monster(choice):
     if choice  == 'orc': # create an orc
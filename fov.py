@@ -0,0 +1,192 @@
+# field of view engines. both are built from a TileMap and share the same small interface:
+#   compute(x, y, radius, light_walls, algo) recomputes the FOV around (x, y),
+#   visible is the resulting mask (one byte per tile, row-major like the TileMap planes),
+#   is_in_fov(x, y) answers a single query from that mask.
+# ShadowcastFov is pure python, so it runs without the libtcod shared library (headless, tests, simulations).
+# recent masks are kept in a small LRU cache, so stepping back onto a tile doesn't recompute anything.
+from collections import OrderedDict
+
+# multipliers that transform the coordinates of the first octant into each of the eight octants
+OCTANTS = [
+    ( 1,  0,  0,  1),
+    ( 0,  1,  1,  0),
+    ( 0, -1,  1,  0),
+    (-1,  0,  0,  1),
+    (-1,  0,  0, -1),
+    ( 0, -1, -1,  0),
+    ( 0,  1, -1,  0),
+    ( 1,  0,  0, -1),
+]
+
+
+def compute_fov(level_map, x, y, radius=0, light_walls=True):
+    # recursive shadowcasting over the map's block_sight plane. returns a visibility mask.
+    # a radius of 0 means unlimited, like libtcod.map_compute_fov
+    width = level_map.width
+    height = level_map.height
+    visible = bytearray(width * height)
+    if not (0 <= x < width and 0 <= y < height):
+        return visible
+    if radius <= 0:
+        radius = width + height  # farther than any tile of the map
+
+    visible[x + y * width] = 1
+    for xx, xy, yx, yy in OCTANTS:
+        _cast_light(level_map.block_sight, visible, width, height, x, y, 1, 1.0, 0.0, radius, xx, xy, yx, yy)
+
+    if not light_walls:
+        # only show the floor: hide every lit tile that blocks sight, except the viewer's own
+        block_sight = level_map.block_sight
+        for i in range(len(visible)):
+            if visible[i] and block_sight[i]:
+                visible[i] = 0
+        visible[x + y * width] = 1
+    return visible
+
+
+def _cast_light(block_sight, visible, width, height, cx, cy, row, start, end, radius, xx, xy, yx, yy):
+    # light one octant, row by row, between the slopes start and end. recurses past each wall.
+    if start < end:
+        return
+    radius_squared = radius * radius
+    new_start = start
+    for j in range(row, radius + 1):
+        dx = -j - 1
+        dy = -j
+        blocked = False
+        while dx <= 0:
+            dx += 1
+            # slopes of the left and right edges of this cell
+            l_slope = (dx - 0.5) / (dy + 0.5)
+            r_slope = (dx + 0.5) / (dy - 0.5)
+            if start < r_slope:
+                continue
+            elif end > l_slope:
+                break
+
+            # translate the relative coordinates into map coordinates
+            mx = cx + dx * xx + dy * xy
+            my = cy + dx * yx + dy * yy
+            inside = 0 <= mx < width and 0 <= my < height
+            if inside and dx * dx + dy * dy <= radius_squared:
+                visible[mx + my * width] = 1
+
+            opaque = not inside or block_sight[mx + my * width]
+            if blocked:
+                # we're scanning a row of blocked cells
+                if opaque:
+                    new_start = r_slope
+                    continue
+                else:
+                    blocked = False
+                    start = new_start
+            elif opaque and j < radius:
+                # this is a blocking cell, start a child scan
+                blocked = True
+                _cast_light(block_sight, visible, width, height, cx, cy, j + 1, start, l_slope, radius, xx, xy, yx, yy)
+                new_start = r_slope
+        # row is scanned; do the next row unless the last cell was blocked
+        if blocked:
+            break
+
+
+class FovCache(object):
+    # a bounded LRU cache of visibility masks. the key includes the map revision,
+    # so masks computed before a tile changed are never returned again.
+    def __init__(self, size=32):
+        self.size = size
+        self.masks = OrderedDict()
+
+    def get(self, key):
+        mask = self.masks.pop(key, None)
+        if mask is not None:
+            self.masks[key] = mask  # most recently used goes last
+        return mask
+
+    def put(self, key, mask):
+        if self.size <= 0:
+            return
+        self.masks[key] = mask
+        if len(self.masks) > self.size:
+            self.masks.popitem(last=False)
+
+    def clear(self):
+        self.masks.clear()
+
+
+class ShadowcastFov(object):
+    # in-process FOV, reading the TileMap directly. doesn't need libtcod at all.
+    def __init__(self, level_map, cache_size=32):
+        self.level_map = level_map
+        self.visible = bytearray(level_map.width * level_map.height)
+        self.cache = FovCache(cache_size)
+
+    def compute(self, x, y, radius=0, light_walls=True, algo=0):
+        # returns the mask from the cache when nothing the FOV depends on has changed.
+        # masks are shared with the cache, so callers must not modify them
+        key = (x, y, radius, light_walls, algo, self.level_map.revision)
+        visible = self.cache.get(key)
+        if visible is None:
+            visible = self.compute_uncached(x, y, radius, light_walls, algo)
+            self.cache.put(key, visible)
+        self.visible = visible
+        return visible
+
+    def compute_uncached(self, x, y, radius, light_walls, algo):
+        # algo is accepted for compatibility with libtcod, shadowcasting is always used
+        return compute_fov(self.level_map, x, y, radius, light_walls)
+
+    def is_in_fov(self, x, y):
+        level_map = self.level_map
+        if 0 <= x < level_map.width and 0 <= y < level_map.height:
+            return bool(self.visible[x + y * level_map.width])
+        return False
+
+
+class LibtcodFov(ShadowcastFov):
+    # FOV computed by libtcod's native map. the result is copied into the same mask so queries stay in python.
+    def __init__(self, level_map, cache_size=32):
+        import libtcodpy as libtcod
+        ShadowcastFov.__init__(self, level_map, cache_size)
+        self.libtcod = libtcod
+        self.tcod_map = libtcod.map_new(level_map.width, level_map.height)
+        self.sync()
+
+    def sync(self):
+        # copy the map's properties into the native FOV map
+        libtcod = self.libtcod
+        level_map = self.level_map
+        i = 0
+        for y in range(level_map.height):
+            for x in range(level_map.width):
+                libtcod.map_set_properties(self.tcod_map, x, y, not level_map.block_sight[i], not level_map.blocked[i])
+                i += 1
+        self.revision = level_map.revision
+
+    def compute_uncached(self, x, y, radius, light_walls, algo):
+        libtcod = self.libtcod
+        if self.revision != self.level_map.revision:
+            self.sync()
+        libtcod.map_compute_fov(self.tcod_map, x, y, radius, light_walls, algo)
+
+        visible = bytearray(self.level_map.width * self.level_map.height)
+        i = 0
+        for my in range(self.level_map.height):
+            for mx in range(self.level_map.width):
+                if libtcod.map_is_in_fov(self.tcod_map, mx, my):
+                    visible[i] = 1
+                i += 1
+        return visible
+
+
+FOV_ENGINES = {
+    'libtcod': LibtcodFov,
+    'shadowcast': ShadowcastFov,
+}
+
+
+def new_fov_map(level_map, engine='libtcod', cache_size=32):
+    # build the FOV engine of the given name for a map
+    if engine not in FOV_ENGINES:
+        raise ValueError('Unknown FOV engine: ' + repr(engine))
+    return FOV_ENGINES[engine](level_map, cache_size)
@@ -0,0 +1,821 @@
+#
+# headless stand-in for libtcodpy: an in-memory console, queued input and the
+# parts of the libtcod API the game uses, in pure python. it doesn't need a
+# display or the libtcod shared library, so the real game loop can run on
+# build boxes, in benchmarks and in soak tests. see backend.py for how it is
+# picked.
+#
+# consoles are plain python objects; 0 (or None) is the root console, as with
+# libtcod. input comes from a queue filled with push_key(), push_char() and
+# push_mouse(). once the queue runs dry the window counts as closed, so the
+# game's main loops end by themselves.
+#
+
+import random
+import textwrap
+from collections import deque
+from ctypes import Structure, c_int, c_uint8, c_bool
+
+HEADLESS = True
+
+############################
+# color module
+############################
+class Color(Structure):
+    _fields_ = [('r', c_uint8),
+                ('g', c_uint8),
+                ('b', c_uint8),
+                ]
+
+    def __eq__(self, c):
+        return isinstance(c, Color) and (self.r, self.g, self.b) == (c.r, c.g, c.b)
+
+    def __ne__(self, c):
+        return not self.__eq__(c)
+
+    def __hash__(self):
+        return hash((self.r, self.g, self.b))
+
+    def __mul__(self, c):
+        if isinstance(c, Color):
+            return Color(self.r * c.r // 255, self.g * c.g // 255, self.b * c.b // 255)
+        else:
+            return Color(*[min(255, max(0, int(v * c))) for v in self])
+
+    def __add__(self, c):
+        return Color(min(255, self.r + c.r), min(255, self.g + c.g), min(255, self.b + c.b))
+
+    def __sub__(self, c):
+        return Color(max(0, self.r - c.r), max(0, self.g - c.g), max(0, self.b - c.b))
+
+    def __repr__(self):
+        return "Color(%d,%d,%d)" % (self.r, self.g, self.b)
+
+    def __getitem__(self, i):
+        if type(i) == str:
+            return getattr(self, i)
+        else:
+            return getattr(self, "rgb"[i])
+
+    def __setitem__(self, i, c):
+        if type(i) == str:
+            setattr(self, i, c)
+        else:
+            setattr(self, "rgb"[i], c)
+
+    def __iter__(self):
+        yield self.r
+        yield self.g
+        yield self.b
+
+# default colors
+# grey levels
+black=Color(0,0,0)
+darkest_grey=Color(31,31,31)
+darker_grey=Color(63,63,63)
+dark_grey=Color(95,95,95)
+grey=Color(127,127,127)
+light_grey=Color(159,159,159)
+lighter_grey=Color(191,191,191)
+lightest_grey=Color(223,223,223)
+darkest_gray=Color(31,31,31)
+darker_gray=Color(63,63,63)
+dark_gray=Color(95,95,95)
+gray=Color(127,127,127)
+light_gray=Color(159,159,159)
+lighter_gray=Color(191,191,191)
+lightest_gray=Color(223,223,223)
+white=Color(255,255,255)
+
+# sepia
+darkest_sepia=Color(31,24,15)
+darker_sepia=Color(63,50,31)
+dark_sepia=Color(94,75,47)
+sepia=Color(127,101,63)
+light_sepia=Color(158,134,100)
+lighter_sepia=Color(191,171,143)
+lightest_sepia=Color(222,211,195)
+
+#standard colors
+red=Color(255,0,0)
+flame=Color(255,63,0)
+orange=Color(255,127,0)
+amber=Color(255,191,0)
+yellow=Color(255,255,0)
+lime=Color(191,255,0)
+chartreuse=Color(127,255,0)
+green=Color(0,255,0)
+sea=Color(0,255,127)
+turquoise=Color(0,255,191)
+cyan=Color(0,255,255)
+sky=Color(0,191,255)
+azure=Color(0,127,255)
+blue=Color(0,0,255)
+han=Color(63,0,255)
+violet=Color(127,0,255)
+purple=Color(191,0,255)
+fuchsia=Color(255,0,255)
+magenta=Color(255,0,191)
+pink=Color(255,0,127)
+crimson=Color(255,0,63)
+
+# dark colors
+dark_red=Color(191,0,0)
+dark_flame=Color(191,47,0)
+dark_orange=Color(191,95,0)
+dark_amber=Color(191,143,0)
+dark_yellow=Color(191,191,0)
+dark_lime=Color(143,191,0)
+dark_chartreuse=Color(95,191,0)
+dark_green=Color(0,191,0)
+dark_sea=Color(0,191,95)
+dark_turquoise=Color(0,191,143)
+dark_cyan=Color(0,191,191)
+dark_sky=Color(0,143,191)
+dark_azure=Color(0,95,191)
+dark_blue=Color(0,0,191)
+dark_han=Color(47,0,191)
+dark_violet=Color(95,0,191)
+dark_purple=Color(143,0,191)
+dark_fuchsia=Color(191,0,191)
+dark_magenta=Color(191,0,143)
+dark_pink=Color(191,0,95)
+dark_crimson=Color(191,0,47)
+
+# darker colors
+darker_red=Color(127,0,0)
+darker_flame=Color(127,31,0)
+darker_orange=Color(127,63,0)
+darker_amber=Color(127,95,0)
+darker_yellow=Color(127,127,0)
+darker_lime=Color(95,127,0)
+darker_chartreuse=Color(63,127,0)
+darker_green=Color(0,127,0)
+darker_sea=Color(0,127,63)
+darker_turquoise=Color(0,127,95)
+darker_cyan=Color(0,127,127)
+darker_sky=Color(0,95,127)
+darker_azure=Color(0,63,127)
+darker_blue=Color(0,0,127)
+darker_han=Color(31,0,127)
+darker_violet=Color(63,0,127)
+darker_purple=Color(95,0,127)
+darker_fuchsia=Color(127,0,127)
+darker_magenta=Color(127,0,95)
+darker_pink=Color(127,0,63)
+darker_crimson=Color(127,0,31)
+
+# darkest colors
+darkest_red=Color(63,0,0)
+darkest_flame=Color(63,15,0)
+darkest_orange=Color(63,31,0)
+darkest_amber=Color(63,47,0)
+darkest_yellow=Color(63,63,0)
+darkest_lime=Color(47,63,0)
+darkest_chartreuse=Color(31,63,0)
+darkest_green=Color(0,63,0)
+darkest_sea=Color(0,63,31)
+darkest_turquoise=Color(0,63,47)
+darkest_cyan=Color(0,63,63)
+darkest_sky=Color(0,47,63)
+darkest_azure=Color(0,31,63)
+darkest_blue=Color(0,0,63)
+darkest_han=Color(15,0,63)
+darkest_violet=Color(31,0,63)
+darkest_purple=Color(47,0,63)
+darkest_fuchsia=Color(63,0,63)
+darkest_magenta=Color(63,0,47)
+darkest_pink=Color(63,0,31)
+darkest_crimson=Color(63,0,15)
+
+# light colors
+light_red=Color(255,114,114)
+light_flame=Color(255,149,114)
+light_orange=Color(255,184,114)
+light_amber=Color(255,219,114)
+light_yellow=Color(255,255,114)
+light_lime=Color(219,255,114)
+light_chartreuse=Color(184,255,114)
+light_green=Color(114,255,114)
+light_sea=Color(114,255,184)
+light_turquoise=Color(114,255,219)
+light_cyan=Color(114,255,255)
+light_sky=Color(114,219,255)
+light_azure=Color(114,184,255)
+light_blue=Color(114,114,255)
+light_han=Color(149,114,255)
+light_violet=Color(184,114,255)
+light_purple=Color(219,114,255)
+light_fuchsia=Color(255,114,255)
+light_magenta=Color(255,114,219)
+light_pink=Color(255,114,184)
+light_crimson=Color(255,114,149)
+
+#lighter colors
+lighter_red=Color(255,165,165)
+lighter_flame=Color(255,188,165)
+lighter_orange=Color(255,210,165)
+lighter_amber=Color(255,232,165)
+lighter_yellow=Color(255,255,165)
+lighter_lime=Color(232,255,165)
+lighter_chartreuse=Color(210,255,165)
+lighter_green=Color(165,255,165)
+lighter_sea=Color(165,255,210)
+lighter_turquoise=Color(165,255,232)
+lighter_cyan=Color(165,255,255)
+lighter_sky=Color(165,232,255)
+lighter_azure=Color(165,210,255)
+lighter_blue=Color(165,165,255)
+lighter_han=Color(188,165,255)
+lighter_violet=Color(210,165,255)
+lighter_purple=Color(232,165,255)
+lighter_fuchsia=Color(255,165,255)
+lighter_magenta=Color(255,165,232)
+lighter_pink=Color(255,165,210)
+lighter_crimson=Color(255,165,188)
+
+# lightest colors
+lightest_red=Color(255,191,191)
+lightest_flame=Color(255,207,191)
+lightest_orange=Color(255,223,191)
+lightest_amber=Color(255,239,191)
+lightest_yellow=Color(255,255,191)
+lightest_lime=Color(239,255,191)
+lightest_chartreuse=Color(223,255,191)
+lightest_green=Color(191,255,191)
+lightest_sea=Color(191,255,223)
+lightest_turquoise=Color(191,255,239)
+lightest_cyan=Color(191,255,255)
+lightest_sky=Color(191,239,255)
+lightest_azure=Color(191,223,255)
+lightest_blue=Color(191,191,255)
+lightest_han=Color(207,191,255)
+lightest_violet=Color(223,191,255)
+lightest_purple=Color(239,191,255)
+lightest_fuchsia=Color(255,191,255)
+lightest_magenta=Color(255,191,239)
+lightest_pink=Color(255,191,223)
+lightest_crimson=Color(255,191,207)
+
+# desaturated colors
+desaturated_red=Color(127,63,63)
+desaturated_flame=Color(127,79,63)
+desaturated_orange=Color(127,95,63)
+desaturated_amber=Color(127,111,63)
+desaturated_yellow=Color(127,127,63)
+desaturated_lime=Color(111,127,63)
+desaturated_chartreuse=Color(95,127,63)
+desaturated_green=Color(63,127,63)
+desaturated_sea=Color(63,127,95)
+desaturated_turquoise=Color(63,127,111)
+desaturated_cyan=Color(63,127,127)
+desaturated_sky=Color(63,111,127)
+desaturated_azure=Color(63,95,127)
+desaturated_blue=Color(63,63,127)
+desaturated_han=Color(79,63,127)
+desaturated_violet=Color(95,63,127)
+desaturated_purple=Color(111,63,127)
+desaturated_fuchsia=Color(127,63,127)
+desaturated_magenta=Color(127,63,111)
+desaturated_pink=Color(127,63,95)
+desaturated_crimson=Color(127,63,79)
+
+# metallic
+brass=Color(191,151,96)
+copper=Color(197,136,124)
+gold=Color(229,191,0)
+silver=Color(203,203,203)
+
+# miscellaneous
+celadon=Color(172,255,175)
+peach=Color(255,159,127)
+
+
+def color_lerp(c1, c2, a):
+    return Color(int(c1.r + (c2.r - c1.r) * a), int(c1.g + (c2.g - c1.g) * a), int(c1.b + (c2.b - c1.b) * a))
+
+############################
+# console module
+############################
+class Key(Structure):
+    _fields_=[('vk', c_int),
+              ('c', c_uint8),
+              ('pressed', c_bool),
+              ('lalt', c_bool),
+              ('lctrl', c_bool),
+              ('ralt', c_bool),
+              ('rctrl', c_bool),
+              ('shift', c_bool),
+              ]
+
+class Mouse(Structure):
+    _fields_=[('x', c_int),
+              ('y', c_int),
+              ('dx', c_int),
+              ('dy', c_int),
+              ('cx', c_int),
+              ('cy', c_int),
+              ('dcx', c_int),
+              ('dcy', c_int),
+              ('lbutton', c_bool),
+              ('rbutton', c_bool),
+              ('mbutton', c_bool),
+              ('lbutton_pressed', c_bool),
+              ('rbutton_pressed', c_bool),
+              ('mbutton_pressed', c_bool),
+              ('wheel_up', c_bool),
+              ('wheel_down', c_bool),
+              ]
+
+# background rendering modes. every mode other than BKGND_NONE simply sets
+# the background color here, no blending is done.
+BKGND_NONE = 0
+BKGND_SET = 1
+BKGND_MULTIPLY = 2
+BKGND_LIGHTEN = 3
+BKGND_DARKEN = 4
+BKGND_SCREEN = 5
+BKGND_COLOR_DODGE = 6
+BKGND_COLOR_BURN = 7
+BKGND_ADD = 8
+BKGND_ADDA = 9
+BKGND_BURN = 10
+BKGND_OVERLAY = 11
+BKGND_ALPH = 12
+BKGND_DEFAULT=13
+
+def BKGND_ALPHA(a):
+    return BKGND_ALPH | (int(a * 255) << 8)
+
+def BKGND_ADDALPHA(a):
+    return BKGND_ADDA | (int(a * 255) << 8)
+
+# non blocking key events types
+KEY_PRESSED = 1
+KEY_RELEASED = 2
+# key codes
+KEY_NONE = 0
+KEY_ESCAPE = 1
+KEY_BACKSPACE = 2
+KEY_TAB = 3
+KEY_ENTER = 4
+KEY_SHIFT = 5
+KEY_CONTROL = 6
+KEY_ALT = 7
+KEY_PAUSE = 8
+KEY_CAPSLOCK = 9
+KEY_PAGEUP = 10
+KEY_PAGEDOWN = 11
+KEY_END = 12
+KEY_HOME = 13
+KEY_UP = 14
+KEY_LEFT = 15
+KEY_RIGHT = 16
+KEY_DOWN = 17
+KEY_PRINTSCREEN = 18
+KEY_INSERT = 19
+KEY_DELETE = 20
+KEY_LWIN = 21
+KEY_RWIN = 22
+KEY_APPS = 23
+KEY_0 = 24
+KEY_1 = 25
+KEY_2 = 26
+KEY_3 = 27
+KEY_4 = 28
+KEY_5 = 29
+KEY_6 = 30
+KEY_7 = 31
+KEY_8 = 32
+KEY_9 = 33
+KEY_KP0 = 34
+KEY_KP1 = 35
+KEY_KP2 = 36
+KEY_KP3 = 37
+KEY_KP4 = 38
+KEY_KP5 = 39
+KEY_KP6 = 40
+KEY_KP7 = 41
+KEY_KP8 = 42
+KEY_KP9 = 43
+KEY_KPADD = 44
+KEY_KPSUB = 45
+KEY_KPDIV = 46
+KEY_KPMUL = 47
+KEY_KPDEC = 48
+KEY_KPENTER = 49
+KEY_F1 = 50
+KEY_F2 = 51
+KEY_F3 = 52
+KEY_F4 = 53
+KEY_F5 = 54
+KEY_F6 = 55
+KEY_F7 = 56
+KEY_F8 = 57
+KEY_F9 = 58
+KEY_F10 = 59
+KEY_F11 = 60
+KEY_F12 = 61
+KEY_NUMLOCK = 62
+KEY_SCROLLLOCK = 63
+KEY_SPACE = 64
+KEY_CHAR = 65
+# font flags
+FONT_LAYOUT_ASCII_INCOL = 1
+FONT_LAYOUT_ASCII_INROW = 2
+FONT_TYPE_GREYSCALE = 4
+FONT_TYPE_GRAYSCALE = 4
+FONT_LAYOUT_TCOD = 8
+# renderers
+RENDERER_GLSL=0
+RENDERER_OPENGL=1
+RENDERER_SDL=2
+NB_RENDERERS=3
+# alignment
+LEFT=0
+RIGHT=1
+CENTER=2
+
+class Console(object):
+    # an in-memory console. each cell has a character code, a foreground and a
+    # background color, stored row-major like libtcod's own buffers.
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.default_background = black
+        self.default_foreground = white
+        self.clear()
+
+    def clear(self):
+        n = self.width * self.height
+        self.char = [ord(' ')] * n
+        self.fore = [tuple(self.default_foreground)] * n
+        self.back = [tuple(self.default_background)] * n
+
+    def inside(self, x, y):
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def put(self, x, y, c, flag=BKGND_DEFAULT):
+        # draw a character with the default foreground color, and the default
+        # background unless the flag is BKGND_NONE
+        if self.inside(x, y):
+            i = x + y * self.width
+            self.char[i] = c if isinstance(c, int) else ord(c)
+            self.fore[i] = tuple(self.default_foreground)
+            if flag != BKGND_NONE:
+                self.back[i] = tuple(self.default_background)
+
+    def text(self):
+        # the characters on the console, one string per row. handy for tests.
+        return [''.join(chr(c) for c in self.char[y * self.width:(y + 1) * self.width])
+            for y in range(self.height)]
+
+_root = None
+_fullscreen = False
+_window_closed = False
+_fps = 0
+_frames = 0
+
+# input events waiting to be polled: ('key', Key) or ('mouse', Mouse)
+events = deque()
+# when True, the window counts as closed once the queue is empty
+close_when_idle = True
+
+def _con(con):
+    # 0 and None stand for the root console, like in libtcod
+    if con is None or (not isinstance(con, Console) and con == 0):
+        return _root
+    return con
+
+def console_init_root(w, h, title, fullscreen=False, renderer=RENDERER_SDL):
+    global _root, _fullscreen, _window_closed
+    _root = Console(w, h)
+    _fullscreen = fullscreen
+    _window_closed = False
+
+def console_get_width(con):
+    return _con(con).width
+
+def console_get_height(con):
+    return _con(con).height
+
+def console_set_custom_font(fontFile, flags=FONT_LAYOUT_ASCII_INCOL, nb_char_horiz=0, nb_char_vertic=0):
+    pass
+
+def console_is_fullscreen():
+    return _fullscreen
+
+def console_set_fullscreen(fullscreen):
+    global _fullscreen
+    _fullscreen = fullscreen
+
+def console_is_window_closed():
+    return _window_closed
+
+def console_close():
+    # headless only: make console_is_window_closed() return True
+    global _window_closed
+    _window_closed = True
+
+def console_new(w, h):
+    return Console(w, h)
+
+def console_delete(con):
+    pass
+
+def console_set_default_background(con, col):
+    _con(con).default_background = Color(col.r, col.g, col.b)
+
+def console_set_default_foreground(con, col):
+    _con(con).default_foreground = Color(col.r, col.g, col.b)
+
+def console_clear(con):
+    _con(con).clear()
+
+def console_put_char(con, x, y, c, flag=BKGND_DEFAULT):
+    _con(con).put(x, y, c, flag)
+
+def console_put_char_ex(con, x, y, c, fore, back):
+    con = _con(con)
+    if con.inside(x, y):
+        i = x + y * con.width
+        con.char[i] = c if isinstance(c, int) else ord(c)
+        con.fore[i] = tuple(fore)
+        con.back[i] = tuple(back)
+
+def console_set_char_background(con, x, y, col, flag=BKGND_SET):
+    con = _con(con)
+    if con.inside(x, y) and flag != BKGND_NONE:
+        con.back[x + y * con.width] = tuple(col)
+
+def console_set_char_foreground(con, x, y, col):
+    con = _con(con)
+    if con.inside(x, y):
+        con.fore[x + y * con.width] = tuple(col)
+
+def console_set_char(con, x, y, c):
+    con = _con(con)
+    if con.inside(x, y):
+        con.char[x + y * con.width] = c if isinstance(c, int) else ord(c)
+
+def console_get_char(con, x, y):
+    con = _con(con)
+    return con.char[x + y * con.width]
+
+def console_get_char_background(con, x, y):
+    con = _con(con)
+    return Color(*con.back[x + y * con.width])
+
+def console_get_char_foreground(con, x, y):
+    con = _con(con)
+    return Color(*con.fore[x + y * con.width])
+
+def _print_line(con, x, y, flag, alignment, line):
+    if alignment == CENTER:
+        x -= len(line) // 2
+    elif alignment == RIGHT:
+        x -= len(line) - 1
+    for c in line:
+        con.put(x, y, c, flag)
+        x += 1
+
+def console_print(con, x, y, fmt):
+    console_print_ex(con, x, y, BKGND_DEFAULT, LEFT, fmt)
+
+def console_print_ex(con, x, y, flag, alignment, fmt):
+    con = _con(con)
+    for j, line in enumerate(fmt.split('\n')):
+        _print_line(con, x, y + j, flag, alignment, line)
+
+def _wrap(w, fmt):
+    # split the text in lines of at most w characters, at word boundaries
+    lines = []
+    for paragraph in fmt.split('\n'):
+        lines.extend(textwrap.wrap(paragraph, w) or [''])
+    return lines
+
+def console_print_rect(con, x, y, w, h, fmt):
+    return console_print_rect_ex(con, x, y, w, h, BKGND_DEFAULT, LEFT, fmt)
+
+def console_print_rect_ex(con, x, y, w, h, flag, alignment, fmt):
+    con = _con(con)
+    if w == 0:
+        w = con.width - x
+    lines = _wrap(w, fmt)
+    if h > 0:
+        lines = lines[:h]
+    for j, line in enumerate(lines):
+        _print_line(con, x, y + j, flag, alignment, line)
+    return len(lines)
+
+def console_get_height_rect(con, x, y, w, h, fmt):
+    if w == 0:
+        w = _con(con).width - x
+    lines = len(_wrap(w, fmt))
+    return min(lines, h) if h > 0 else lines
+
+def console_rect(con, x, y, w, h, clr, flag=BKGND_DEFAULT):
+    con = _con(con)
+    for j in range(y, y + h):
+        for i in range(x, x + w):
+            if con.inside(i, j):
+                if clr:
+                    con.char[i + j * con.width] = ord(' ')
+                if flag != BKGND_NONE:
+                    con.back[i + j * con.width] = tuple(con.default_background)
+
+def _fade(dst, src, a):
+    if a >= 1.0:
+        return src
+    return tuple(int(d + (s - d) * a) for d, s in zip(dst, src))
+
+def console_blit(src, x, y, w, h, dst, xdst, ydst, ffade=1.0, bfade=1.0):
+    src = _con(src)
+    dst = _con(dst)
+    if w == 0:
+        w = src.width
+    if h == 0:
+        h = src.height
+    for j in range(h):
+        for i in range(w):
+            sx, sy, dx, dy = x + i, y + j, xdst + i, ydst + j
+            if not (src.inside(sx, sy) and dst.inside(dx, dy)):
+                continue
+            si = sx + sy * src.width
+            di = dx + dy * dst.width
+            dst.back[di] = _fade(dst.back[di], src.back[si], bfade)
+            dst.fore[di] = _fade(dst.fore[di], src.fore[si], ffade)
+            dst.char[di] = src.char[si]
+
+def console_fill_foreground(con, r, g, b):
+    con = _con(con)
+    if len(r) != len(g) or len(r) != len(b):
+        raise TypeError('R, G and B must all have the same size.')
+    con.fore = [(int(cr), int(cg), int(cb)) for cr, cg, cb in zip(r, g, b)]
+
+def console_fill_background(con, r, g, b):
+    con = _con(con)
+    if len(r) != len(g) or len(r) != len(b):
+        raise TypeError('R, G and B must all have the same size.')
+    con.back = [(int(cr), int(cg), int(cb)) for cr, cg, cb in zip(r, g, b)]
+
+def console_fill_char(con, arr):
+    _con(con).char = [int(c) for c in arr]
+
+def console_flush():
+    global _frames
+    _frames += 1
+
+############################
+# input
+############################
+EVENT_KEY_PRESS=1
+EVENT_KEY_RELEASE=2
+EVENT_KEY=EVENT_KEY_PRESS|EVENT_KEY_RELEASE
+EVENT_MOUSE_MOVE=4
+EVENT_MOUSE_PRESS=8
+EVENT_MOUSE_RELEASE=16
+EVENT_MOUSE=EVENT_MOUSE_MOVE|EVENT_MOUSE_PRESS|EVENT_MOUSE_RELEASE
+EVENT_ANY=EVENT_KEY|EVENT_MOUSE
+
+def push_key(vk=KEY_CHAR, c=0, lalt=False, lctrl=False, shift=False):
+    # queue a key press
+    k = Key()
+    k.vk = vk
+    k.c = c if isinstance(c, int) else ord(c)
+    k.pressed = True
+    k.lalt = lalt
+    k.lctrl = lctrl
+    k.shift = shift
+    events.append(('key', k))
+
+def push_char(c):
+    # queue the key press of a printable character
+    push_key(KEY_CHAR, c)
+
+def push_mouse(cx, cy, lbutton_pressed=False, rbutton_pressed=False):
+    # queue a mouse event on the cell (cx, cy)
+    m = Mouse()
+    m.cx = cx
+    m.cy = cy
+    m.lbutton_pressed = lbutton_pressed
+    m.rbutton_pressed = rbutton_pressed
+    events.append(('mouse', m))
+
+def _copy(dst, src):
+    for name, kind in src._fields_:
+        setattr(dst, name, getattr(src, name))
+
+def _idle():
+    global _window_closed
+    if close_when_idle:
+        _window_closed = True
+
+def sys_check_for_event(mask, k, m):
+    # take the next queued event matching the mask, if any. like libtcod, the
+    # key and mouse structures are reset when there is nothing to report.
+    _copy(k, Key())
+    m.lbutton_pressed = m.rbutton_pressed = m.mbutton_pressed = False
+    while events:
+        kind, event = events.popleft()
+        if kind == 'key' and mask & EVENT_KEY_PRESS:
+            _copy(k, event)
+            return EVENT_KEY_PRESS
+        if kind == 'mouse' and mask & EVENT_MOUSE:
+            _copy(m, event)
+            return EVENT_MOUSE_PRESS if event.lbutton_pressed or event.rbutton_pressed else EVENT_MOUSE_MOVE
+    _idle()
+    return 0
+
+def sys_wait_for_event(mask, k, m, flush):
+    return sys_check_for_event(mask, k, m)
+
+def console_wait_for_keypress(flush):
+    # the next queued key press. if there is none the window is closed, and
+    # Escape is returned so menus get cancelled.
+    k = Key()
+    while events:
+        kind, event = events.popleft()
+        if kind == 'key':
+            _copy(k, event)
+            return k
+    _idle()
+    k.vk = KEY_ESCAPE
+    k.c = 27
+    k.pressed = True
+    return k
+
+def console_check_for_keypress(flags=KEY_RELEASED):
+    k = Key()
+    if events and events[0][0] == 'key':
+        _copy(k, events.popleft()[1])
+    return k
+
+############################
+# sys module
+############################
+def sys_set_fps(fps):
+    # frames are never capped here, the value is only remembered
+    global _fps
+    _fps = fps
+
+def sys_get_fps():
+    return _fps
+
+def sys_get_frame_count():
+    # headless only: how many times console_flush() was called
+    return _frames
+
+############################
+# image module
+############################
+class Image(object):
+    def __init__(self, filename):
+        self.filename = filename
+
+def image_load(filename):
+    return Image(filename)
+
+def image_blit_2x(image, console, dx, dy, sx=0, sy=0, w=-1, h=-1):
+    pass
+
+def image_delete(image):
+    pass
+
+############################
+# random module
+############################
+RNG_MT = 0
+RNG_CMWC = 1
+
+_random = random.Random()
+
+def random_get_instance():
+    return _random
+
+def random_new(algo=RNG_CMWC):
+    return random.Random()
+
+def random_new_from_seed(seed, algo=RNG_CMWC):
+    return random.Random(seed)
+
+def random_set_seed(seed):
+    # headless only: reseed the default generator, so runs can be reproduced
+    _random.seed(seed)
+
+def _rng(rnd):
+    return rnd if isinstance(rnd, random.Random) else _random
+
+def random_get_int(rnd, mi, ma):
+    if mi > ma:
+        mi, ma = ma, mi
+    return _rng(rnd).randint(mi, ma)
+
+def random_get_float(rnd, mi, ma):
+    return _rng(rnd).uniform(mi, ma)
+
+def random_get_double(rnd, mi, ma):
+    return _rng(rnd).uniform(mi, ma)
+
+def random_delete(rnd):
+    pass
@@ -1,19 +1,223 @@
-class Tile(object):
-    # a tile of the map and its properties
-    def __init__(self, blocked, block_sight = None):
-        self.blocked = blocked
+from collections import deque
+from itertools import count
 
-        # all tiles start unexplored
-        self.explored = False
+# the components objects can be looked up by, see ObjectList.having()
+COMPONENTS = ('fighter', 'ai', 'item')
+
+
+class TileView(object):
+    # a view of a single cell of a TileMap, with its blocked, block_sight and explored properties.
+    # reads and writes go straight to the map's planes.
+    __slots__ = ('level_map', 'i')
+
+    def __init__(self, level_map, i):
+        self.level_map = level_map
+        self.i = i
+
+    @property
+    def blocked(self):
+        return bool(self.level_map.blocked[self.i])
+
+    @blocked.setter
+    def blocked(self, value):
+        self.level_map.blocked[self.i] = bool(value)
+        self.level_map.revision += 1
+
+    @property
+    def block_sight(self):
+        return bool(self.level_map.block_sight[self.i])
+
+    @block_sight.setter
+    def block_sight(self, value):
+        self.level_map.block_sight[self.i] = bool(value)
+        self.level_map.revision += 1
+
+    @property
+    def explored(self):
+        return bool(self.level_map.explored[self.i])
+
+    @explored.setter
+    def explored(self, value):
+        self.level_map.explored[self.i] = bool(value)
+
+    def tunnel(self):
+        self.level_map.tunnel(self.i % self.level_map.width, self.i // self.level_map.width)
+
+
+class TileColumn(object):
+    # one column of a TileMap, so that level_map[x][y] keeps working for existing callers
+    __slots__ = ('level_map', 'x')
+
+    def __init__(self, level_map, x):
+        self.level_map = level_map
+        self.x = x
+
+    def __getitem__(self, y):
+        if not 0 <= y < self.level_map.height:
+            raise IndexError('map row out of range')
+        return TileView(self.level_map, self.x + y * self.level_map.width)
+
+    def __len__(self):
+        return self.level_map.height
+
+
+class TileMap(object):
+    # the whole map, stored as flat planes with one byte per tile, in row-major order (index = x + y * width).
+    # level_map[x][y] returns a TileView; hot paths should read the planes directly at x + y * width.
+    # revision goes up whenever blocked or block_sight change, so anything derived from them (like FOV) can be cached.
+    # code writing to those planes directly must call touch() itself.
+    def __init__(self, width, height, blocked=True, block_sight=None):
+        self.width = width
+        self.height = height
+        n = width * height
 
         # by default, if a tile is blocked, it also blocks sight
         if block_sight is None:
             block_sight = blocked
-        self.block_sight = block_sight
+        self.blocked = bytearray((b'\x01' if blocked else b'\x00') * n)
+        self.block_sight = bytearray((b'\x01' if block_sight else b'\x00') * n)
 
-    def tunnel(self):
-        self.blocked = False
-        self.block_sight = False
+        # all tiles start unexplored
+        self.explored = bytearray(n)
+
+        self.revision = 0
+
+        # what's lying around on the floor, like corpses
+        self.decals = DecalLayer(width)
+
+    def __getitem__(self, x):
+        if not 0 <= x < self.width:
+            raise IndexError('map column out of range')
+        return TileColumn(self, x)
+
+    def __len__(self):
+        return self.width
+
+    def touch(self):
+        # record that the terrain changed
+        self.revision += 1
+
+    def tunnel(self, x, y):
+        i = x + y * self.width
+        self.blocked[i] = 0
+        self.block_sight[i] = 0
+        self.revision += 1
+
+    def tunnel_rect(self, x1, y1, x2, y2):
+        # make every tile in the inclusive rectangle passable, one row slice at a time
+        w = self.width
+        empty = bytearray(x2 - x1 + 1)
+        for y in range(y1, y2 + 1):
+            start = x1 + y * w
+            self.blocked[start:start + len(empty)] = empty
+            self.block_sight[start:start + len(empty)] = empty
+        self.revision += 1
+
+    def tunnel_column(self, x, y1, y2):
+        # make a vertical run of tiles passable with a single strided slice
+        w = self.width
+        start = x + y1 * w
+        stop = x + y2 * w + 1
+        empty = bytearray(y2 - y1 + 1)
+        self.blocked[start:stop:w] = empty
+        self.block_sight[start:stop:w] = empty
+        self.revision += 1
+
+    def carve_room(self, room):
+        # the room's outline stays solid, only its inside is dug out
+        if room.x2 - room.x1 > 1 and room.y2 - room.y1 > 1:
+            self.tunnel_rect(room.x1 + 1, room.y1 + 1, room.x2 - 1, room.y2 - 1)
+
+    def carve_h_tunnel(self, x1, x2, y):
+        self.tunnel_rect(min(x1, x2), y, max(x1, x2), y)
+
+    def carve_v_tunnel(self, y1, y2, x):
+        self.tunnel_column(x, min(y1, y2), max(y1, y2))
+
+    def carve_corridor(self, x1, y1, x2, y2, horizontal_first=True):
+        # an L-shaped corridor from (x1, y1) to (x2, y2), turning at (x2, y1) or (x1, y2)
+        if horizontal_first:
+            self.carve_h_tunnel(x1, x2, y1)
+            self.carve_v_tunnel(y1, y2, x2)
+        else:
+            self.carve_v_tunnel(y1, y2, x1)
+            self.carve_h_tunnel(x1, x2, y2)
+
+    def carve(self, rooms=(), corridors=()):
+        # carve a whole batch of rooms (Rects) and corridors, each given as (x1, y1, x2, y2, horizontal_first)
+        for room in rooms:
+            self.carve_room(room)
+        for corridor in corridors:
+            self.carve_corridor(*corridor)
+
+
+class Decal(object):
+    # something on a tile that's only ever looked at, like a corpse
+    __slots__ = ('char', 'color', 'name', 'born')
+
+    def __init__(self, char, color, name, born=0):
+        self.char = char
+        self.color = color
+        self.name = name
+        self.born = born
+
+
+class DecalLayer(object):
+    # the decals of a map by tile index, at most one per tile: a new one replaces the old.
+    # with a lifetime, a decal goes away that many ticks after it was added (the game ticks once a turn).
+    # the tiles whose decal changed are collected in dirty, for the renderer to look at and clear
+    def __init__(self, width, lifetime=None):
+        self.width = width
+        self.lifetime = lifetime
+        self.now = 0
+        self.decals = {}  # tile index -> Decal
+        self.added = deque()  # (tile index, decal), oldest first
+        self.dirty = set()  # tile indexes
+
+    def __len__(self):
+        return len(self.decals)
+
+    def add(self, x, y, char, color, name):
+        decal = Decal(char, color, name, self.now)
+        i = x + y * self.width
+        self.decals[i] = decal
+        self.added.append((i, decal))
+        self.dirty.add(i)
+        return decal
+
+    def at(self, x, y):
+        # the decal on a tile, or None
+        return self.decals.get(x + y * self.width)
+
+    def remove(self, x, y):
+        i = x + y * self.width
+        if self.decals.pop(i, None) is not None:
+            self.dirty.add(i)
+
+    def tick(self):
+        # one turn went by: drop the decals that are past their lifetime
+        self.now += 1
+        added = self.added
+        if self.lifetime is None:
+            if len(added) > 2 * len(self.decals):
+                self.compact()
+            return
+        while added and added[0][1].born + self.lifetime <= self.now:
+            i, decal = added.popleft()
+            if self.decals.get(i) is decal:
+                del self.decals[i]
+                self.dirty.add(i)
+
+    def compact(self):
+        # forget the decals that were replaced since they were added
+        decals = self.decals
+        self.added = deque((i, d) for (i, d) in self.added if decals.get(i) is d)
+
+    def items(self):
+        # (x, y, decal) for every decal
+        width = self.width
+        for i, decal in self.decals.items():
+            yield i % width, i // width, decal
 
 
 class Rect(object):
@@ -35,18 +239,105 @@ class Rect(object):
                 self.y1 <= other.y2 and self.y2 >= other.y1)
 
 
+class ObjectList(list):
+    # the objects on a level, plus an index of which objects stand on each tile.
+    # add and remove them through the usual list methods, and move them with place() so the index follows.
+    # the objects having each component are kept in a set per component, so systems only visit those.
+    # objects are drawn by layer (their layer attribute, lowest first), in the order they entered it, see draw_key().
+    # the tiles where an object came, went or moved are collected in dirty, for the renderer to look at and clear
+    def __init__(self, objs=()):
+        list.__init__(self)
+        self.cells = {}
+        self.dirty = set()  # (x, y) tiles
+        self.entered = {}  # object -> when it entered the level, as a serial number
+        self.serial = count()
+        self.members = dict((name, set()) for name in COMPONENTS)  # component -> the objects with one
+        self.extend(objs)
+
+    def _index(self, obj):
+        self.cells.setdefault((obj.x, obj.y), []).append(obj)
+        self.dirty.add((obj.x, obj.y))
+
+    def _unindex(self, obj):
+        cell = self.cells.get((obj.x, obj.y))
+        if cell and obj in cell:
+            cell.remove(obj)
+            if not cell:
+                del self.cells[(obj.x, obj.y)]
+            self.dirty.add((obj.x, obj.y))
+            return True
+        return False
+
+    def _register(self, obj):
+        for name in COMPONENTS:
+            if getattr(obj, name, None) is not None:
+                self.members[name].add(obj)
+        self.entered[obj] = next(self.serial)
+        self._index(obj)
+
+    def _unregister(self, obj):
+        for members in self.members.values():
+            members.discard(obj)
+        del self.entered[obj]
+        self._unindex(obj)
+
+    def append(self, obj):
+        list.append(self, obj)
+        self._register(obj)
+
+    def insert(self, i, obj):
+        list.insert(self, i, obj)
+        self._register(obj)
+
+    def extend(self, objs):
+        for obj in objs:
+            self.append(obj)
+
+    def remove(self, obj):
+        list.remove(self, obj)
+        self._unregister(obj)
+
+    def draw_key(self, obj):
+        # of two objects on the same tile, the one with the greater key is drawn over the other
+        return (obj.layer, self.entered[obj])
+
+    def place(self, obj, x, y):
+        # move an object to a new tile, keeping the index up to date if it is on this level
+        indexed = self._unindex(obj)
+        obj.x = x
+        obj.y = y
+        if indexed:
+            self._index(obj)
+
+    def having(self, component):
+        # the objects that have a component ('fighter', 'ai' or 'item'), in the order they entered the level.
+        # components are only ever taken away (a dead monster loses its fighter and AI), which is noticed here
+        members = self.members[component]
+        gone = [obj for obj in members if getattr(obj, component) is None]
+        members.difference_update(gone)
+        return sorted(members, key=self.entered.get)
+
+    def at(self, x, y):
+        # all the objects standing on a tile
+        return self.cells.get((x, y), ())
+
+    def blocked_at(self, x, y):
+        # true if an object blocking movement stands on the tile
+        return any(o.blocks for o in self.cells.get((x, y), ()))
+
+
 def create_room(level_map, room):
-    # go through the tiles in the rectangle and make them passable
-    for x in range(room.x1 + 1, room.x2):
-        for y in range(room.y1 + 1, room.y2):
-            level_map[x][y].tunnel()
+    # make the inside of the rectangle passable
+    level_map.carve_room(room)
 
 
 def create_h_tunnel(level_map, x1, x2, y):
-    for x in range(min(x1, x2), max(x1, x2) + 1):
-        level_map[x][y].tunnel()
+    level_map.carve_h_tunnel(x1, x2, y)
 
 
 def create_v_tunnel(level_map, y1, y2, x):
-    for y in range(min(y1, y2), max(y1, y2) + 1):
-        level_map[x][y].tunnel()
+    level_map.carve_v_tunnel(y1, y2, x)
+
+
+def create_corridor(level_map, x1, y1, x2, y2, horizontal_first=True):
+    level_map.carve_corridor(x1, y1, x2, y2, horizontal_first)
@@ -1,5 +1,5 @@
 import textwrap
-import libtcodpy as libtcod
+from backend import libtcod
 from constants import MSG_WIDTH, MSG_HEIGHT
 
 
@@ -0,0 +1,206 @@
+# path finding over a TileMap's blocked plane. walkers move one tile in any of the eight directions.
+import heapq
+from array import array
+from collections import deque
+
+UNREACHED = 0xffff
+
+# the eight steps a walker can take, orthogonal ones first so they win ties
+STEPS = [(0, -1), (0, 1), (-1, 0), (1, 0), (-1, -1), (1, -1), (-1, 1), (1, 1)]
+
+
+class DistanceMap(object):
+    # the number of steps from every walkable tile to a goal (the player), found by a breadth-first flood fill.
+    # one map is shared by everything chasing that goal: it's refilled only when the goal moves or the
+    # terrain changes, and each chaser then walks downhill on it in constant time.
+    # limit stops the fill that many steps from the goal, tiles beyond it are UNREACHED.
+    def __init__(self, level_map, limit=None):
+        self.level_map = level_map
+        self.limit = limit
+        self.distance = array('H', [UNREACHED]) * (level_map.width * level_map.height)
+        self.key = None  # goal and map revision of the last fill
+
+    def update(self, x, y):
+        # make sure the map leads to (x, y)
+        key = (x, y, self.level_map.revision)
+        if key != self.key:
+            self.fill(x, y)
+            self.key = key
+
+    def fill(self, x, y):
+        level_map = self.level_map
+        width = level_map.width
+        height = level_map.height
+        blocked = level_map.blocked
+        limit = min(self.limit or UNREACHED - 1, UNREACHED - 1)
+
+        distance = array('H', [UNREACHED]) * (width * height)
+        distance[x + y * width] = 0
+        frontier = deque([(x, y)])
+        while frontier:
+            cx, cy = frontier.popleft()
+            d = distance[cx + cy * width] + 1
+            if d > limit:
+                break  # breadth first, so everything left in the frontier is at the limit too
+            for dx, dy in STEPS:
+                nx = cx + dx
+                ny = cy + dy
+                if 0 <= nx < width and 0 <= ny < height:
+                    j = nx + ny * width
+                    if distance[j] == UNREACHED and not blocked[j]:
+                        distance[j] = d
+                        frontier.append((nx, ny))
+        self.distance = distance
+
+    def at(self, x, y):
+        level_map = self.level_map
+        if 0 <= x < level_map.width and 0 <= y < level_map.height:
+            return self.distance[x + y * level_map.width]
+        return UNREACHED
+
+    def step(self, x, y, is_blocked):
+        # the free step (dx, dy) from (x, y) that gets closest to the goal, or None if every way down is blocked
+        best = None
+        best_distance = self.at(x, y)
+        for dx, dy in STEPS:
+            d = self.at(x + dx, y + dy)
+            if d < best_distance and not is_blocked(x + dx, y + dy):
+                best = (dx, dy)
+                best_distance = d
+        return best
+
+
+def cost_map(level_map):
+    # the cost of stepping onto each tile, row-major like the TileMap planes. 0 means it can't be entered
+    return array('B', [0 if b else 1 for b in level_map.blocked])
+
+
+def astar(costs, width, height, start, goal, max_nodes=None):
+    # the cheapest path from start to goal over a cost map, as a list of (x, y) steps that excludes start
+    # and ends on goal, or None when there's none (within max_nodes expanded tiles, if given).
+    # the goal itself may be impassable (it's usually somebody standing there).
+    # diagonal steps cost the same as orthogonal ones, so the heuristic is the chebyshev distance
+    (x, y) = start
+    (gx, gy) = goal
+    start_i = x + y * width
+    goal_i = gx + gy * width
+    if start_i == goal_i:
+        return []
+
+    cost_so_far = {start_i: 0}
+    came_from = {start_i: None}
+    frontier = [(max(abs(gx - x), abs(gy - y)), 0, start_i)]
+    expanded = 0
+    while frontier:
+        _, g, i = heapq.heappop(frontier)
+        if i == goal_i:
+            break
+        if g > cost_so_far[i]:
+            continue  # a cheaper way here was found after this one was queued
+        expanded += 1
+        if max_nodes is not None and expanded > max_nodes:
+            return None
+
+        cx = i % width
+        cy = i // width
+        for dx, dy in STEPS:
+            nx = cx + dx
+            ny = cy + dy
+            if not (0 <= nx < width and 0 <= ny < height):
+                continue
+            j = nx + ny * width
+            cost = costs[j] or (1 if j == goal_i else 0)
+            if not cost:
+                continue
+            new_cost = g + cost
+            if j not in cost_so_far or new_cost < cost_so_far[j]:
+                cost_so_far[j] = new_cost
+                came_from[j] = i
+                heapq.heappush(frontier, (new_cost + max(abs(gx - nx), abs(gy - ny)), new_cost, j))
+    else:
+        return None
+
+    # walk back from the goal
+    path = []
+    i = goal_i
+    while i != start_i:
+        path.append((i % width, i // width))
+        i = came_from[i]
+    path.reverse()
+    return path
+
+
+class Pathfinder(object):
+    # A* over a TileMap, keeping the path of every actor that asked for one. a path is only searched again
+    # when the target moved more than tolerance tiles from where it led, when a tile on it got blocked,
+    # or when the actor strayed off it. the cost map is rebuilt when the map's revision changes.
+    def __init__(self, level_map, tolerance=2, max_nodes=None):
+        self.level_map = level_map
+        self.tolerance = tolerance
+        self.max_nodes = max_nodes
+        self.paths = {}  # actor -> [goal, map revision, steps left]
+        self.costs = None
+        self.revision = None
+
+    def cost_map(self):
+        if self.revision != self.level_map.revision:
+            self.costs = cost_map(self.level_map)
+            self.revision = self.level_map.revision
+        return self.costs
+
+    def find(self, start, goal, avoid=()):
+        # a path from start to goal, going around the tiles in avoid
+        level_map = self.level_map
+        costs = self.cost_map()
+        if avoid:
+            costs = array('B', costs)
+            for (x, y) in avoid:
+                costs[x + y * level_map.width] = 0
+        return astar(costs, level_map.width, level_map.height, start, goal, self.max_nodes)
+
+    def forget(self, actor):
+        self.paths.pop(actor, None)
+
+    def next_step(self, actor, x, y, is_blocked=None):
+        # the next tile (x, y) for actor on its way to (x, y) the target, or None if there's no way there.
+        # when is_blocked(x, y) says that tile is taken (by another monster), a way around it is searched
+        path = self.paths.get(actor)
+        if path is not None and not self._still_good(actor, path, x, y):
+            path = None
+        if path is None:
+            steps = self.find((actor.x, actor.y), (x, y))
+            if steps is None:
+                self.forget(actor)
+                return None
+            path = self.paths[actor] = [(x, y), self.level_map.revision, steps]
+
+        steps = path[2]
+        if steps and steps[0] == (actor.x, actor.y):
+            steps.pop(0)  # the actor took the last step
+        if not steps:
+            return None
+        if is_blocked is not None and steps[0] != (x, y) and is_blocked(*steps[0]):
+            detour = self.find((actor.x, actor.y), (x, y), [steps[0]])
+            if detour:
+                path[2] = steps = detour
+        return steps[0]
+
+    def _still_good(self, actor, path, x, y):
+        (goal_x, goal_y), revision, steps = path
+        if max(abs(goal_x - x), abs(goal_y - y)) > self.tolerance:
+            return False
+        if steps and steps[0] == (actor.x, actor.y):
+            steps = steps[1:]
+        if not steps:
+            return False  # used up, but the target isn't reached yet
+        # the actor must still be next to the path
+        if max(abs(steps[0][0] - actor.x), abs(steps[0][1] - actor.y)) > 1:
+            return False
+        if revision != self.level_map.revision:
+            # the terrain changed: check the tiles still ahead
+            costs = self.cost_map()
+            width = self.level_map.width
+            if not all(costs[sx + sy * width] for (sx, sy) in steps[:-1]):
+                return False
+            path[1] = self.level_map.revision
+        return True
@@ -0,0 +1,148 @@
+# per-phase frame timings and counters for the game loop, with an optional overlay on the GUI panel.
+# the game wraps each phase of a frame in "with stats.phase(name):" and calls stats.end_frame() once per frame.
+# while disabled (the default) phase() returns a shared do-nothing context, so the cost is a method call.
+import timeit
+from collections import deque
+
+clock = timeit.default_timer
+
+
+class _NoPhase(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+NO_PHASE = _NoPhase()
+
+
+class _Phase(object):
+    def __init__(self, stats, name):
+        self.stats = stats
+        self.name = name
+
+    def __enter__(self):
+        self.start = clock()
+        return self
+
+    def __exit__(self, *exc):
+        self.stats.add_time(self.name, (clock() - self.start) * 1000.0)
+        return False
+
+
+class CallCounter(object):
+    # stands in for libtcodpy's _lib, counting the calls made into the shared library
+    def __init__(self, lib):
+        self.lib = lib
+        self.calls = 0
+
+    def __getattr__(self, name):
+        func = getattr(self.lib, name)
+
+        def counted(*args):
+            self.calls += 1
+            return func(*args)
+        return counted
+
+
+class FrameStats(object):
+    # rolling statistics over the last `window` frames.
+    # times are in milliseconds per phase and frame; counters are totals per frame.
+    def __init__(self, window=120):
+        self.window = window
+        self.enabled = False
+        self.hud = False
+        self.times = {}
+        self.counters = {}
+        self.frame_times = {}
+        self.frame_counts = {}
+        self.frame_start = None
+        self.library = None
+        self.library_module = None
+
+    def enable(self, hud=False, library=None):
+        # start collecting. library is the libtcod module whose calls into the shared library are counted, if any
+        self.enabled = True
+        self.hud = hud
+        if library is not None and hasattr(library, '_lib') and not isinstance(library._lib, CallCounter):
+            self.library_module = library
+            self.library = library._lib = CallCounter(library._lib)
+
+    def disable(self):
+        self.enabled = False
+        self.hud = False
+        if self.library_module is not None:
+            self.library_module._lib = self.library.lib
+            self.library_module = self.library = None
+        self.frame_start = None
+
+    def reset(self):
+        self.times.clear()
+        self.counters.clear()
+        self.frame_times.clear()
+        self.frame_counts.clear()
+
+    def phase(self, name):
+        if not self.enabled:
+            return NO_PHASE
+        return _Phase(self, name)
+
+    def add_time(self, name, ms):
+        self.frame_times[name] = self.frame_times.get(name, 0.0) + ms
+
+    def count(self, name, n=1):
+        if self.enabled:
+            self.frame_counts[name] = self.frame_counts.get(name, 0) + n
+
+    def end_frame(self):
+        # close the current frame and fold its numbers into the rolling window
+        if not self.enabled:
+            return
+        now = clock()
+        if self.frame_start is not None:
+            self.add_time('frame', (now - self.frame_start) * 1000.0)
+        self.frame_start = now
+        if self.library is not None:
+            self.frame_counts['library_calls'] = self.library.calls
+            self.library.calls = 0
+
+        for name, ms in self.frame_times.items():
+            self.times.setdefault(name, deque(maxlen=self.window)).append(ms)
+        for name, n in self.frame_counts.items():
+            self.counters.setdefault(name, deque(maxlen=self.window)).append(n)
+        self.frame_times = {}
+        self.frame_counts = {}
+
+    def summary(self):
+        # {'times': {phase: {mean_ms, p95_ms, max_ms}}, 'counters': {name: {mean, p95, max}}} over the window
+        return {
+            'times': dict((name, _describe(values, '_ms')) for name, values in self.times.items() if values),
+            'counters': dict((name, _describe(values, '')) for name, values in self.counters.items() if values),
+        }
+
+    def hud_lines(self, width):
+        # two short lines for the overlay: the frame time, and the slowest phase
+        summary = self.summary()['times']
+        frame = summary.get('frame')
+        if frame is None:
+            return []
+        lines = ['frame %.1f p95 %.1f' % (frame['mean_ms'], frame['p95_ms'])]
+        phases = [(s['mean_ms'], name) for name, s in summary.items() if name != 'frame' and '/' not in name]
+        if phases:
+            ms, name = max(phases)
+            lines.append('%s %.1f max %.1f' % (name, ms, summary[name]['max_ms']))
+        return [line[:width] for line in lines]
+
+
+def _describe(values, unit):
+    values = sorted(values)
+    return {
+        'mean' + unit: sum(values) / float(len(values)),
+        'p95' + unit: values[min(len(values) - 1, int(len(values) * 0.95))],
+        'max' + unit: values[-1],
+    }
+
+
+# the statistics of the running game
+stats = FrameStats()
@@ -1,21 +1,30 @@
-import libtcodpy as libtcod
+from backend import libtcod
 import math
-import shelve
+try:  # NumPy is optional, it makes the map pass a few array operations
+    import numpy
+except ImportError:
+    numpy = None
 from constants import (MAP_WIDTH, MAP_HEIGHT,
                       SCREEN_WIDTH, SCREEN_HEIGHT,
                       ROOM_MAX_SIZE, ROOM_MIN_SIZE, MAX_ROOMS,
-                      FOV_LIGHT_WALLS, FOV_ALGO,
+                      FOV_LIGHT_WALLS, FOV_ALGO, FOV_ENGINE, FOV_CACHE_SIZE,
                       MSG_X, BAR_WIDTH,
                       INVENTORY_WIDTH, LEVEL_SCREEN_WIDTH, CHARACTER_SCREEN_WIDTH,
                       PANEL_HEIGHT, PANEL_Y,
                       LEVEL_UP_BASE, LEVEL_UP_FACTOR,
-                      LIMIT_FPS,
+                      LIMIT_FPS, TURN_TIME, ACTIVATION_RADIUS, MELEE_NOISE_RADIUS, FLOW_FIELD_RANGE, PATH_TOLERANCE, BATCH_MIN_MONSTERS,
                       color_dark_wall, color_dark_ground, color_light_wall, color_light_ground,
-                      TORCH_RADIUS)
-from levelmap import Tile, Rect, create_room, create_h_tunnel, create_v_tunnel
-from statics import Item, Equipment, make_item
-from dynamics import Fighter, player_death, player_manaless, build_monster
+                      TORCH_RADIUS,
+                      LAYER_FEATURE, LAYER_ITEM, LAYER_ACTOR, LAYER_PLAYER, CORPSE_LIFETIME, SAVE_FILE)
+from levelmap import TileMap, Rect, ObjectList, create_room, create_corridor
+from fov import new_fov_map
+from scheduler import Scheduler
+from pathing import DistanceMap, Pathfinder, UNREACHED, STEPS
+from statics import Inventory, Item, Equipment, make_item, LETTERS
+from dynamics import Fighter, BasicMonster, player_death, player_manaless, build_monster
 from messages import Messaging
+import savefile
+import perf
 
 
 # Current global values
@@ -27,7 +36,10 @@ game_state = None
 
 # map
 objects = None
+actors = None  # the scheduler of the objects that act on this level
 level_map = None
+flow_field = None  # distances to the player, shared by the chasing monsters
+pathfinder = None  # A* paths of the objects walking somewhere
 stairs = None
 dungeon_level = None
 
@@ -36,14 +48,37 @@ key = None
 mouse = None
 
 # display
+rendering = True  # when False, render_all only keeps the FOV up to date (headless simulations)
 fov_map = None
 fov_recompute = None
+tiles_shown = None  # the look of each map tile as last painted on con, see TILE_COLORS
+lit_box = None  # the part of the map the last FOV pass could have lit
+chars_shown = None  # the object characters last drawn on con, by position
+view_mask = None  # the FOV mask and lit box the objects were last drawn for, see changed_cells()
+view_box = None
+
+# looks of a map tile, indexes in TILE_COLORS
+TILE_UNSEEN, TILE_DARK_WALL, TILE_DARK_GROUND, TILE_LIGHT_WALL, TILE_LIGHT_GROUND = range(5)
+TILE_COLORS = [libtcod.black, color_dark_wall, color_dark_ground, color_light_wall, color_light_ground]
+if numpy is not None:
+    # the same palette as one array per channel, to look up the colors of a whole map of looks at once
+    TILE_R = numpy.array([c.r for c in TILE_COLORS], dtype=numpy.intc)
+    TILE_G = numpy.array([c.g for c in TILE_COLORS], dtype=numpy.intc)
+    TILE_B = numpy.array([c.b for c in TILE_COLORS], dtype=numpy.intc)
+    # the steps of pathing.STEPS, as offsets per axis
+    STEP_DX = numpy.array([dx for (dx, dy) in STEPS])
+    STEP_DY = numpy.array([dy for (dx, dy) in STEPS])
 
 
 class GameObject(object):
     # this is a generic object: the player, a monster, an item, the stairs...
     # it's always represented by a character on screen.
-    def __init__(self, x, y, char, name, color, blocks=False, always_visible=False, fighter=None, ai=None, item=None, equipment=None):
+    # its attributes live in slots; the __dict__ slot keeps room for extra ones like player.level,
+    # and is only allocated for the objects that get one.
+    __slots__ = ('x', 'y', 'char', 'name', 'color', 'blocks', 'always_visible', 'speed', 'layer',
+        'fighter', 'inventory', 'ai', 'item', 'equipment', '__dict__')
+
+    def __init__(self, x, y, char, name, color, blocks=False, always_visible=False, fighter=None, ai=None, item=None, equipment=None, speed=1, inventory=None, layer=None):
         self.x = x
         self.y = y
         self.char = char
@@ -51,8 +86,9 @@ class GameObject(object):
         self.color = color
         self.blocks = blocks
         self.always_visible = always_visible
+        self.speed = speed  # actions per turn of the player
         self.fighter = fighter
-        self.inventory = []
+        self.inventory = inventory  # only for objects that carry items, like the player
         if self.fighter:  # let the fighter component know who owns it
             self.fighter.owner = self
 
@@ -71,11 +107,15 @@ class GameObject(object):
             self.item = Item()
             self.item.owner = self
 
+        # the render layer: by default, fighters are drawn above items, and items above anything else
+        if layer is None:
+            layer = LAYER_ACTOR if fighter else LAYER_ITEM if self.item else LAYER_FEATURE
+        self.layer = layer
+
     def move(self, dx, dy):
         # move by the given amount, if the destination is not blocked
         if not is_blocked(self.x + dx, self.y + dy):
-            self.x += dx
-            self.y += dy
+            objects.place(self, self.x + dx, self.y + dy)
 
     def move_towards(self, target_x, target_y):
         # vector from this object to the target, and distance
@@ -89,6 +129,28 @@ class GameObject(object):
         dy = int(round(dy / distance))
         self.move(dx, dy)
 
+    def move_towards_player(self):
+        # walk downhill on the distance map from the player, which finds the way around walls.
+        # out of the map's range, fall back to a straight line
+        flow_field.update(player.x, player.y)
+        if flow_field.at(self.x, self.y) == UNREACHED:
+            self.move_towards(player.x, player.y)
+            return
+        step = flow_field.step(self.x, self.y, is_blocked)
+        if step is not None:
+            objects.place(self, self.x + step[0], self.y + step[1])
+
+    def attack(self, target, message):
+        # fight target, which makes noise. returns the game state the fight leads to, like Fighter.attack
+        make_noise(target.x, target.y, MELEE_NOISE_RADIUS)
+        return self.fighter.attack(target, message, player)
+
+    def walk_towards(self, target_x, target_y):
+        # follow a path found by A* to the target. the path is kept between turns
+        step = pathfinder.next_step(self, target_x, target_y, is_blocked)
+        if step is not None and not is_blocked(*step):
+            objects.place(self, *step)
+
     def distance_to(self, other):
         # return the distance to another object
         dx = other.x - self.x
@@ -99,36 +161,37 @@ class GameObject(object):
         # return the distance to some coordinates
         return math.sqrt((x - self.x) ** 2 + (y - self.y) ** 2)
 
-    def send_to_back(self):
-        # make this object be drawn first, so all others appear above it if they're in the same tile.
+    def leave_remains(self):
+        # take this object off the level, leaving its look behind as a decal on the map
         objects.remove(self)
-        objects.insert(0, self)
+        actors.remove(self)
+        pathfinder.forget(self)
+        level_map.decals.add(self.x, self.y, self.char, self.color, self.name)
 
-    def draw(self):
+    def is_shown(self):
         # only show if it's visible to the player; or it's set to "always visible" and on an explored tile
-        if (libtcod.map_is_in_fov(fov_map, self.x, self.y) or
-            (self.always_visible and level_map[self.x][self.y].explored)):
-            # set the color and then draw the character that represents this object at its position
-            libtcod.console_set_default_foreground(con, self.color)
-            libtcod.console_put_char(con, self.x, self.y, self.char, libtcod.BKGND_NONE)
+        return (fov_map.is_in_fov(self.x, self.y) or
+            (self.always_visible and level_map.explored[self.x + self.y * level_map.width]))
 
-    def clear(self):
-        # erase the character that represents this object
-        libtcod.console_put_char(con, self.x, self.y, ' ', libtcod.BKGND_NONE)
+def make_noise(x, y, radius):
+    # something loud happened at (x, y): the dormant monsters within radius hear it and wake up
+    actors.wake_around(x, y, radius)
 
 def is_blocked(x, y):
-    return level_map[x][y].blocked or any(o.blocks for o in objects if (o.x, o.y) == (x, y))
+    return level_map.blocked[x + y * level_map.width] or objects.blocked_at(x, y)
 
 
 def make_map():
-    global level_map, objects, stairs
+    global level_map, objects, stairs, actors, flow_field, pathfinder
 
-    objects = [player]
+    objects = ObjectList([player])
+    actors = Scheduler(TURN_TIME, ACTIVATION_RADIUS)
 
     # fill map with "blocked" tiles
-    level_map = [[ Tile(True)
-        for y in range(MAP_HEIGHT) ]
-            for x in range(MAP_WIDTH) ]
+    level_map = TileMap(MAP_WIDTH, MAP_HEIGHT, True)
+    level_map.decals.lifetime = CORPSE_LIFETIME
+    flow_field = DistanceMap(level_map, FLOW_FIELD_RANGE)
+    pathfinder = Pathfinder(level_map, PATH_TOLERANCE)
 
     rooms = []
 
@@ -149,24 +212,18 @@ def make_map():
             (new_x, new_y) = new_room.center()
             if not rooms:
                 # this is the first room, where the player starts at
-                player.x = new_x
-                player.y = new_y
+                objects.place(player, new_x, new_y)
             else:
                 place_objects(new_room)
                 # connect it to the previous room with a tunnel
                 prev_x, prev_y = rooms[-1].center()
-                if libtcod.random_get_int(0, 0, 1) == 1:
-                    create_h_tunnel(level_map, prev_x, new_x, prev_y)
-                    create_v_tunnel(level_map, prev_y, new_y, new_x)
-                else:
-                    create_v_tunnel(level_map, prev_y, new_y, prev_x)
-                    create_h_tunnel(level_map, prev_x, new_x, new_y)
+                horizontal_first = libtcod.random_get_int(0, 0, 1) == 1
+                create_corridor(level_map, prev_x, prev_y, new_x, new_y, horizontal_first)
             rooms.append(new_room)
 
     # create stairs at the centre of the last room
     stairs = GameObject(new_x, new_y, '<', 'stairs', libtcod.white, always_visible=True)
-    objects.append(stairs)
-    stairs.send_to_back() # so it's drawn below the monsters
+    objects.append(stairs)  # a feature, so it's drawn below the items and monsters
 
 def random_choice_index(chances): # choose one option from the list of chances, returning it's index.
     # the dice will land on some number between 1 and the sum of the chances
@@ -214,6 +271,7 @@ def place_objects(room):
             symbol, colour, fighter_component, ai_component = build_monster(choice)
             monster = GameObject(x, y, symbol, choice, colour, blocks=True, fighter=fighter_component, ai=ai_component)
             objects.append(monster)
+            actors.add(monster)
 
     item_chances = {}
     item_chances['heal'] = 35
@@ -237,8 +295,7 @@ def place_objects(room):
             choice = random_choice(item_chances)
             symbol, name, colour, item_component, equipment_component = make_item(choice)
             item = GameObject(x, y, symbol,name, colour, item=item_component, equipment=equipment_component)
-            objects.append(item)
-            item.send_to_back()  # items appear below other objects
+            objects.append(item)  # items appear below monsters, in their own layer
             item.always_visible = True # items are always visible even out of FOV, if in an explored area
 
 def render_bar(x, y, total_width, name, value, maximum, bar_color, back_color):
@@ -264,52 +321,167 @@ def get_names_under_mouse():
     (x, y) = (mouse.cx, mouse.cy)
 
     # create a list with the names of all objects at the mouse's coordinates and in FOV
-    names = [obj.name for obj in objects
-        if obj.x == x and obj.y == y and libtcod.map_is_in_fov(fov_map, obj.x, obj.y)]
+    names = [obj.name for obj in objects.at(x, y)
+        if fov_map.is_in_fov(obj.x, obj.y)]
+    decal = level_map.decals.at(x, y) if 0 <= x < MAP_WIDTH and 0 <= y < MAP_HEIGHT else None
+    if decal is not None and fov_map.is_in_fov(x, y):
+        names.insert(0, decal.name)
 
     names = ', '.join(names)  # join the names, separated by commas
     return names.capitalize()
 
-def render_all():
+def fov_box(x, y):
+    # the rectangle (x1, y1, x2, y2) that a FOV computed from (x, y) can light, clipped to the map
+    if TORCH_RADIUS <= 0:
+        return (0, 0, MAP_WIDTH - 1, MAP_HEIGHT - 1)
+    r = TORCH_RADIUS + 1
+    return (max(x - r, 0), max(y - r, 0), min(x + r, MAP_WIDTH - 1), min(y + r, MAP_HEIGHT - 1))
+
+def render_map_vectorized(in_fov):
+    # set the background color of all the tiles according to the FOV, using array operations
+    # over the FOV mask and the map planes, and push them to con with a single call
+    visible = numpy.frombuffer(in_fov, dtype=numpy.uint8).astype(bool)
+    explored = numpy.frombuffer(level_map.explored, dtype=numpy.uint8)  # a view, writes go to the map
+    wall = numpy.frombuffer(level_map.block_sight, dtype=numpy.uint8).astype(bool)
+
+    # since they're visible, explore them
+    explored[visible] = 1
+
+    look = numpy.where(visible,
+        numpy.where(wall, TILE_LIGHT_WALL, TILE_LIGHT_GROUND),
+        numpy.where(wall, TILE_DARK_WALL, TILE_DARK_GROUND))
+    # if it's not visible right now, the player can only see it if it's explored
+    look[explored == 0] = TILE_UNSEEN
+
+    libtcod.console_fill_background(con, TILE_R[look], TILE_G[look], TILE_B[look])
+
+def render_map(in_fov):
+    # set the background color of the tiles according to the FOV, repainting only those whose look changed.
+    # only tiles lit now or lit by the previous FOV can change, so just the boxes around both viewpoints are checked
+    global lit_box
+
+    box = fov_box(player.x, player.y)
+    if lit_box is None or lit_box[4] != level_map.revision:
+        # first frame on this map, or the terrain changed: check everything
+        boxes = [(0, 0, MAP_WIDTH - 1, MAP_HEIGHT - 1)]
+    else:
+        boxes = [lit_box[:4], box]
+
+    block_sight = level_map.block_sight
+    explored = level_map.explored
+    for (x1, y1, x2, y2) in boxes:
+        for y in range(y1, y2 + 1):
+            i = x1 + y * MAP_WIDTH
+            for x in range(x1, x2 + 1):
+                if in_fov[i]:
+                    # it's visible, and since it's visible, explore it
+                    look = TILE_LIGHT_WALL if block_sight[i] else TILE_LIGHT_GROUND
+                    explored[i] = 1
+                elif explored[i]:
+                    # if it's not visible right now, the player can only see it if it's explored
+                    look = TILE_DARK_WALL if block_sight[i] else TILE_DARK_GROUND
+                else:
+                    look = TILE_UNSEEN
+                if look != tiles_shown[i]:
+                    libtcod.console_set_char_background(con, x, y, TILE_COLORS[look], libtcod.BKGND_SET)
+                    tiles_shown[i] = look
+                i += 1
+
+    lit_box = box + (level_map.revision,)
+
+def changed_cells():
+    # the cells whose look may have changed since the last frame: those where an object or a decal came, went
+    # or moved, and when the FOV changed, those it lit before or lights now
+    global view_mask, view_box
+
+    cells = objects.dirty
+    objects.dirty = set()
+    decals = level_map.decals
+    for i in decals.dirty:
+        cells.add((i % MAP_WIDTH, i // MAP_WIDTH))
+    decals.dirty.clear()
+
+    mask = fov_map.visible
+    if view_mask is None:
+        # first frame on this map: everything that can be shown
+        cells.update(objects.cells)
+        cells.update((i % MAP_WIDTH, i // MAP_WIDTH) for i in range(len(mask)) if mask[i])
+    elif mask is not view_mask:
+        # only cells lit before or now can change, and of those, only the ones whose visibility did
+        box = fov_box(player.x, player.y)
+        for (x1, y1, x2, y2) in (view_box, box):
+            for y in range(y1, y2 + 1):
+                for i in range(x1 + y * MAP_WIDTH, x2 + y * MAP_WIDTH + 1):
+                    if mask[i] != view_mask[i]:
+                        cells.add((i % MAP_WIDTH, y))
+    view_mask = mask
+    view_box = fov_box(player.x, player.y)
+
+    cells.add((player.x, player.y))  # the player's look changes in place (death, running out of mana)
+    return cells
+
+def shown_at(x, y):
+    # what is drawn on a cell: the top object in view, else the decal if it's in FOV, or None
+    top = None
+    for object in objects.at(x, y):
+        if object.is_shown() and (top is None or objects.draw_key(object) > objects.draw_key(top)):
+            top = object
+    if top is None and fov_map.visible[x + y * MAP_WIDTH]:
+        top = level_map.decals.at(x, y)
+    return top
+
+def render_objects():
+    # draw the objects in view, touching only the cells whose character changed since the last frame.
+    # objects are drawn layer by layer, and in the order they were added to a layer; the player
+    # always appears over all other objects, being alone in the top layer. below them all lie the decals
+    drawn = 0
+    for (x, y) in changed_cells():
+        object = shown_at(x, y)
+        if object is None:
+            if chars_shown.pop((x, y), None) is not None:
+                libtcod.console_put_char(con, x, y, ' ', libtcod.BKGND_NONE)
+            continue
+        # compare colors by value, so no libtcod call is needed to tell whether a cell changed
+        look = (object.char, object.color.r, object.color.g, object.color.b)
+        if chars_shown.get((x, y)) != look:
+            libtcod.console_set_default_foreground(con, object.color)
+            libtcod.console_put_char(con, x, y, object.char, libtcod.BKGND_NONE)
+            chars_shown[(x, y)] = look
+            drawn += 1
+    perf.stats.count('objects_drawn', drawn)
+
+def update_fov():
+    # recompute FOV if needed (the player moved or something). returns the new mask, or None if it didn't change
     global fov_recompute
 
     if fov_recompute:
-        # recompute FOV if needed (the player moved or something)
         fov_recompute = False
-        libtcod.map_compute_fov(fov_map, player.x, player.y, TORCH_RADIUS, FOV_LIGHT_WALLS, FOV_ALGO)
-
-        # go through all tiles, and set their background color according to the FOV
-        for y in range(MAP_HEIGHT):
-            for x in range(MAP_WIDTH):
-                visible = libtcod.map_is_in_fov(fov_map, x, y)
-                wall = level_map[x][y].block_sight
-                if not visible:
-                    # if it's not visible right now, the player can only see it if it's explored
-                    if level_map[x][y].explored:
-                        if wall:
-                            libtcod.console_set_char_background(con, x, y, color_dark_wall, libtcod.BKGND_SET)
-                        else:
-                            libtcod.console_set_char_background(con, x, y, color_dark_ground, libtcod.BKGND_SET)
-                else:
-                    # it's visible
-                    if wall:
-                        libtcod.console_set_char_background(con, x, y, color_light_wall, libtcod.BKGND_SET )
-                    else:
-                        libtcod.console_set_char_background(con, x, y, color_light_ground, libtcod.BKGND_SET )
-                    # since it's visible, explore it
-                    level_map[x][y].explored = True
+        return fov_map.compute(player.x, player.y, TORCH_RADIUS, FOV_LIGHT_WALLS, FOV_ALGO)
+    return None
 
-    # draw all objects in the list, except the player. we want it to
-    # always appear over all other objects! so it's drawn later.
-    for object in objects:
-        if object != player:
-            object.draw()
-    player.draw()
+def render_all():
+    with perf.stats.phase('render/fov'):
+        in_fov = update_fov()
+    if not rendering:
+        return
+
+    if in_fov is not None:
+        with perf.stats.phase('render/map'):
+            if numpy is not None:
+                render_map_vectorized(in_fov)
+            else:
+                render_map(in_fov)
+
+    with perf.stats.phase('render/objects'):
+        render_objects()
 
-    # blit the contents of "con" to the root console
-    libtcod.console_blit(con, 0, 0, MAP_WIDTH, MAP_HEIGHT, 0, 0, 0)
+        # blit the contents of "con" to the root console
+        libtcod.console_blit(con, 0, 0, MAP_WIDTH, MAP_HEIGHT, 0, 0, 0)
 
+    with perf.stats.phase('render/panel'):
+        render_panel()
 
+def render_panel():
     # prepare to render the GUI panel
     libtcod.console_set_default_background(panel, libtcod.black)
     libtcod.console_clear(panel)
@@ -334,6 +506,12 @@ def render_all():
     libtcod.console_set_default_foreground(panel, libtcod.light_gray)
     libtcod.console_print_ex(panel, 1, 0, libtcod.BKGND_NONE, libtcod.LEFT, get_names_under_mouse())
 
+    # performance overlay (toggled with F3), under the dungeon level
+    if perf.stats.hud:
+        libtcod.console_set_default_foreground(panel, libtcod.light_green)
+        for y, line in enumerate(perf.stats.hud_lines(BAR_WIDTH), 5):
+            libtcod.console_print_ex(panel, 1, y, libtcod.BKGND_NONE, libtcod.LEFT, line)
+
     # blit the contents of "panel" to the root console
     libtcod.console_blit(panel, 0, 0, SCREEN_WIDTH, PANEL_HEIGHT, 0, 0, PANEL_Y)
 
@@ -344,10 +522,10 @@ def player_move_or_attack(dx, dy):
     x = player.x + dx
     y = player.y + dy
 
-    for object in objects:
-        if object.fighter and object.x == x and object.y == y:
+    for object in objects.at(x, y):
+        if object.fighter:
             # if there is a target attack it
-            game_state = player.fighter.attack(object, game_msgs, player) or game_state
+            game_state = player.attack(object, game_msgs) or game_state
             break
     else:
         # no target so move
@@ -365,7 +543,7 @@ def check_level_up():
         game_msgs('Your battle skills grow stronger! You reached level ' + str(player.level) + '!', libtcod.yellow)
 
         choice = None
-        while choice == None: #  Keep asking until choice is made.
+        while choice == None and not libtcod.console_is_window_closed(): #  Keep asking until choice is made.
             choice = menu('Level up! Choose a stat to raise:\n',
                 ['Constitution (+20 HP, from ' + str(player.fighter.base_max_hp) + ')',
                 'Strength (+1 attack, from ' + str(player.fighter.base_power) + ')',
@@ -378,8 +556,9 @@ def check_level_up():
         elif choice == 2:
             player.fighter.base_defense += 1
 
-def menu(header, options, width):
-    if len(options) > 26: raise ValueError('Cannot have a menu with more than 26 options.')
+def menu(header, options, width, letters=LETTERS):
+    # the options are chosen with the given letters, in order
+    if len(options) > len(letters): raise ValueError('Cannot have a menu with more than ' + str(len(letters)) + ' options.')
 
     # calculate total height for the header (after auto-wrap) and one line per option
     header_height = libtcod.console_get_height_rect(con, 0, 0, width, SCREEN_HEIGHT, header)
@@ -396,12 +575,10 @@ def menu(header, options, width):
 
     # print all the options
     y = header_height
-    letter_index = ord('a')
-    for option_text in options:
-        text = '(' + chr(letter_index) + ') ' + option_text
+    for letter, option_text in zip(letters, options):
+        text = '(' + letter + ') ' + option_text
         libtcod.console_print_ex(window, 0, y, libtcod.BKGND_NONE, libtcod.LEFT, text)
         y += 1
-        letter_index += 1
 
     # blit the contents of "window" to the root console
     x = SCREEN_WIDTH/2 - width/2
@@ -416,28 +593,35 @@ def menu(header, options, width):
         libtcod.console_set_fullscreen(not libtcod.console_is_fullscreen())
 
     # convert the ASCII code to an index; if it corresponds to an option, return it
-    index = key.c - ord('a')
-    if index >= 0 and index < len(options): return index
+    if 0 < key.c < 256 and chr(key.c) in letters[:len(options)]:
+        return letters.index(chr(key.c))
     return None
 
 def inventory_menu(header):
     # show a menu with each item of the inventory as an option
+    # each entry keeps its letter, and identical items are shown once with their number
     if len(player.inventory) == 0:
         options = ['Inventory is empty.']
+        letters = LETTERS
     else:
         options = []
+        letters = ''
         for item in player.inventory:
             text = item.name
+            count = player.inventory.count(item)
+            if count > 1:
+                text = text + ' (x' + str(count) + ')'
             # show additional information, in case it's equipped
             if item.equipment and item.equipment.is_equipped:
                 text = text + ' (on ' + item.equipment.slot + ')'
             options.append(text)
+            letters += player.inventory.letter(item)
 
-    index = menu(header, options, INVENTORY_WIDTH)
+    index = menu(header, options, INVENTORY_WIDTH, letters)
 
     # if an item was chosen, return it
     if index is None or len(player.inventory) == 0: return None
-    return player.inventory[index].item
+    return player.inventory.get(letters[index]).item
 
 def msgbox(text, width=50):
     menu(text, [], width)  # use menu() as a sort of "message box"
@@ -450,6 +634,13 @@ def handle_keys():
     elif key.vk == libtcod.KEY_ESCAPE:
         return 'exit'  # exit game
 
+    elif key.vk == libtcod.KEY_F3:
+        # F3: toggle the performance overlay, and the timing behind it
+        if perf.stats.hud:
+            perf.stats.disable()
+        else:
+            perf.stats.enable(hud=True, library=libtcod)
+
     if game_state == 'playing':
         # movement keys
         if key.vk == libtcod.KEY_UP:
@@ -469,15 +660,15 @@ def handle_keys():
 
             if key_char == 'g':
                 # pick up an item
-                for object in objects:  # look for an item in the player's tile
-                    if object.x == player.x and object.y == player.y and object.item:
+                for object in objects.at(player.x, player.y):  # look for an item in the player's tile
+                    if object.item:
                         object.item.pick_up(player.inventory, game_msgs, objects)
                         break
             elif key_char == 'i':
                 # show the inventory; if an item is selected, use it
                 chosen_item = inventory_menu('Press the key next to an item to use it, or any other to cancel.\n')
                 if chosen_item is not None:
-                    chosen_item.use(game_msgs, player, objects, target_monster, closest_monster, target_tile)
+                    chosen_item.use(game_msgs, player, objects, target_monster, closest_monster, target_tile, make_noise)
             elif key_char == 'd':
                 # show the inventory; if an item is selected, drop it
                 chosen_item = inventory_menu('Press the key next to an item to drop it, or any other to cancel.\n')
@@ -509,32 +700,27 @@ def next_level():
     initialize_fov()
 
 def save_game():
-    # open a new empty shelve (possibly overwriting an old one) to write the game data
-    file = shelve.open('savegame', 'n')
-    file['map'] = level_map
-    file['objects'] = objects
-    file['player_index'] = objects.index(player)  # index of player in objects list
-    file['stairs_index'] = objects.index(stairs)
-    file['inventory'] = player.inventory
-    file['game_msgs'] = game_msgs.tolist()
-    file['game_state'] = game_state
-    file['dungeon_level'] = dungeon_level
-    file.close()
+    # write the game data to the save file (possibly overwriting an old one), see savefile.py for the format
+    savefile.save(SAVE_FILE, level_map, objects, player, stairs, game_msgs, game_state, dungeon_level)
 
 def load_game():
-    # open the previously saved shelve and load the game data
-    global level_map, objects, player, game_msgs, game_state, dungeon_level, stairs
-
-    file = shelve.open('savegame', 'r')
-    level_map = file['map']
-    objects = file['objects']
-    player = objects[file['player_index']]  # get index of player in objects list and access it
-    stairs = objects[file['stairs_index']]
-    player.inventory = file['inventory']
-    game_msgs = Messaging(*file['game_msgs'])
-    game_state = file['game_state']
-    dungeon_level = file['dungeon_level']
-    file.close()
+    # read the game data from the save file
+    global level_map, objects, player, game_msgs, game_state, dungeon_level, stairs, actors, flow_field, pathfinder
+
+    game = savefile.load(SAVE_FILE, GameObject)
+    level_map = game['level_map']
+    flow_field = DistanceMap(level_map, FLOW_FIELD_RANGE)
+    pathfinder = Pathfinder(level_map, PATH_TOLERANCE)
+    objects = game['objects']
+    actors = Scheduler(TURN_TIME, ACTIVATION_RADIUS)  # and the turn order
+    for obj in objects.having('ai'):
+        actors.add(obj)
+    player = game['player']
+    stairs = game['stairs']
+    Fighter.equipment_changed()  # the equipment came from the save
+    game_msgs = game['game_msgs']
+    game_state = game['game_state']
+    dungeon_level = game['dungeon_level']
 
     initialize_fov()
 
@@ -542,7 +728,7 @@ def new_game():
     global player, game_msgs, game_state, dungeon_level, npc
 
     fighter_component = Fighter(hp=30, mp=30, defense=2, power=2, xp=0, death_function=player_death, manaless_function=player_manaless)
-    player = GameObject(0, 0, '@', 'player', libtcod.white, blocks=True, fighter=fighter_component)
+    player = GameObject(0, 0, '@', 'player', libtcod.white, blocks=True, fighter=fighter_component, inventory=Inventory(), layer=LAYER_PLAYER)
 #    ai_component = BasicNPC()
 #    npc = GameObject(player.x, player.y-2, '@', 'npc', libtcod.dark_red, blocks=True, ai=ai_component)
 
@@ -562,16 +748,18 @@ def new_game():
     obj.always_visible = True
 
 def initialize_fov():
-    global fov_recompute, fov_map
+    global fov_recompute, fov_map, tiles_shown, lit_box, chars_shown, view_mask, view_box
     fov_recompute = True
 
     # create the FOV map, according to the generated map
-    fov_map = libtcod.map_new(MAP_WIDTH, MAP_HEIGHT)
-    for y in range(MAP_HEIGHT):
-        for x in range(MAP_WIDTH):
-            libtcod.map_set_properties(fov_map, x, y, not level_map[x][y].block_sight, not level_map[x][y].blocked)
+    fov_map = new_fov_map(level_map, FOV_ENGINE, FOV_CACHE_SIZE)
 
     libtcod.console_clear(con)  # unexplored areas start black (which is the default background color)
+    tiles_shown = bytearray(MAP_WIDTH * MAP_HEIGHT)
+    lit_box = None
+    chars_shown = {}
+    view_mask = None
+    view_box = None
 
 def target_tile(max_range=None):
     # return the position of a tile left-clicked in player's FOV (optionally in a range), or (None,None) if right-clicked.
@@ -582,11 +770,11 @@ def target_tile(max_range=None):
         render_all()
         x, y = mouse.cx, mouse.cy
 
-        if mouse.rbutton_pressed or key.vk == libtcod.KEY_ESCAPE:
-            return None, None  # cancel if the player right-clicked or pressed Escape
+        if mouse.rbutton_pressed or key.vk == libtcod.KEY_ESCAPE or libtcod.console_is_window_closed():
+            return None, None  # cancel if the player right-clicked or pressed Escape (or the window was closed)
 
         # accept the target if the player clicked in FOV, and in case a range is specified, if it's in that range
-        if (mouse.lbutton_pressed and libtcod.map_is_in_fov(fov_map, x, y) and
+        if (mouse.lbutton_pressed and fov_map.is_in_fov(x, y) and
             (max_range is None or player.distance(x, y) <= max_range)):
             return x, y
 
@@ -598,52 +786,158 @@ def target_monster(max_range=None):
             return None
 
         # return the first clicked monster, otherwise continue looping
-        for obj in objects:
-            if obj.x == x and obj.y == y and obj.fighter and obj != player:
+        for obj in objects.at(x, y):
+            if obj.fighter and obj != player:
                 return obj
 
 def closest_monster(max_range):
     # find closest enemy, up to a maximum range, and in the player's FOV
-    fighters = ((player.distance_to(o), o) for o in objects if o.fighter and not o == player)
-    visible_fighters = [(d, o) for d, o in fighters if d <= max_range if libtcod.map_is_in_fov(fov_map, o.x, o.y)]
+    fighters = ((player.distance_to(o), o) for o in objects.having('fighter') if not o == player)
+    visible_fighters = [(d, o) for d, o in fighters if d <= max_range if fov_map.is_in_fov(o.x, o.y)]
     if visible_fighters:
         return min(visible_fighters)[1]
     else:
         return None
 
-def play_game():
-    global key, mouse, game_state
+def play_turn():
+    # act on the key just polled: the player's action, then the monsters' turn. returns the player's action
+    global game_state
 
-    player_action = None
+    # check for levelling up
+    if game_state == 'playing':
+        check_level_up()
+
+    # handle keys and exit game if needed
+    with perf.stats.phase('keys'):
+        player_action = handle_keys()
+    if player_action == 'exit':
+        return player_action
+
+    # let monsters take their turn
+    if game_state == 'playing' and player_action != 'didnt-take-turn':
+        with perf.stats.phase('ai'):
+            take_monster_turns()
+
+    return player_action
+
+def take_monster_turns():
+    # the player's action took a turn: every object with an AI whose next action falls in it takes its turn,
+    # except those dormant far away from the player
+    global game_state
+
+    actors.advance()
+    actors.activate(player.x, player.y)
+    level_map.decals.tick()
+    due = list(actors.due())
+    plans = {}
+    if numpy is not None:
+        plans = plan_basic_monsters([o for o in due if type(o.ai) is BasicMonster])
+
+    for object in due:
+        plan = plans.pop(object, None)  # an object acting twice in a turn only has a plan for its first action
+        if plan is not None and type(object.ai) is BasicMonster:
+            game_state = follow_plan(object, plan) or game_state
+        else:
+            game_state = object.ai.take_turn(game_msgs, fov_map, player) or game_state
+
+def plan_basic_monsters(monsters):
+    # work out, for a whole batch of basic monsters at once, what BasicMonster.take_turn would base its move on:
+    # whether each one is in FOV, whether it's next to the player, and its steps down the flow field, best first.
+    # nothing here depends on where the other monsters stand, so the plans stay right while the batch moves;
+    # follow_plan then applies them one monster at a time, in turn order, checking for blocked tiles as it goes.
+    if len(monsters) < BATCH_MIN_MONSTERS:
+        return {}
+    xs = numpy.array([o.x for o in monsters])
+    ys = numpy.array([o.y for o in monsters])
+    here = xs + ys * MAP_WIDTH
+
+    in_fov = numpy.frombuffer(fov_map.visible, dtype=numpy.uint8)[here].astype(bool)
+    far = (player.x - xs) ** 2 + (player.y - ys) ** 2 >= 4  # distance_to(player) >= 2
+    chasing = in_fov & far
+    steps = [None] * len(monsters)
+    if chasing.any():
+        flow_field.update(player.x, player.y)
+        distance = numpy.frombuffer(flow_field.distance, dtype=numpy.uint16)
+        cx = xs[chasing]
+        cy = ys[chasing]
+        nx = cx[:, None] + STEP_DX
+        ny = cy[:, None] + STEP_DY
+        inside = (nx >= 0) & (nx < MAP_WIDTH) & (ny >= 0) & (ny < MAP_HEIGHT)
+        around = numpy.where(inside, distance[numpy.where(inside, nx + ny * MAP_WIDTH, 0)], UNREACHED)
+        # a stable sort keeps the order of STEPS among equally good steps, like DistanceMap.step
+        order = numpy.argsort(around, axis=1, kind='mergesort')
+        ranked = around[numpy.arange(len(cx))[:, None], order]
+        downhill = ranked < distance[here[chasing]][:, None]
+        unreached = distance[here[chasing]] == UNREACHED
+        for k, i in enumerate(numpy.flatnonzero(chasing)):
+            if unreached[k]:
+                steps[i] = None  # out of the flow field's range, go in a straight line
+            else:
+                steps[i] = [STEPS[s] for s in order[k][downhill[k]]]
+
+    return dict((o, (in_fov[i], far[i], steps[i])) for i, o in enumerate(monsters))
+
+def follow_plan(monster, plan):
+    # BasicMonster.take_turn, from a plan made by plan_basic_monsters
+    in_fov, far, steps = plan
+    if in_fov:
+        if far:
+            if steps is None:
+                monster.move_towards(player.x, player.y)
+                return
+            for (dx, dy) in steps:
+                if not is_blocked(monster.x + dx, monster.y + dy):
+                    objects.place(monster, monster.x + dx, monster.y + dy)
+                    return
+        elif player.fighter.hp > 0:
+            return monster.attack(player, game_msgs)
+
+def play_game():
+    global key, mouse
 
     mouse = libtcod.Mouse()
     key = libtcod.Key()
     while not libtcod.console_is_window_closed():
         # render the screen
-        libtcod.sys_check_for_event(libtcod.EVENT_KEY_PRESS|libtcod.EVENT_MOUSE,key,mouse)
-        render_all()
-
-        libtcod.console_flush()
+        with perf.stats.phase('poll'):
+            libtcod.sys_check_for_event(libtcod.EVENT_KEY_PRESS|libtcod.EVENT_MOUSE,key,mouse)
+        with perf.stats.phase('render'):
+            render_all()
 
-        # check for levelling up
-        if game_state == 'playing':
-            check_level_up()
+        with perf.stats.phase('flush'):
+            libtcod.console_flush()
 
-        # erase all objects at their old locations, before they move
-        for object in objects:
-            object.clear()
-
-        # handle keys and exit game if needed
-        player_action = handle_keys()
+        player_action = play_turn()
+        perf.stats.end_frame()
         if player_action == 'exit':
             save_game()
             break
 
-        # let monsters take their turn
-        if game_state == 'playing' and player_action != 'didnt-take-turn':
-            for object in objects:
-                if object.ai:
-                    game_state = object.ai.take_turn(game_msgs, fov_map, player) or game_state
+def simulate_game():
+    # play from the queued input as fast as possible: no frame cap, and no drawing unless rendering is set.
+    # stops when the input runs out, the player dies or presses Escape (without saving). returns the turns played
+    global key, mouse
+
+    mouse = libtcod.Mouse()
+    key = libtcod.Key()
+    libtcod.sys_set_fps(0)
+    turns = 0
+    while not libtcod.console_is_window_closed() and game_state != 'dead':
+        with perf.stats.phase('poll'):
+            libtcod.sys_check_for_event(libtcod.EVENT_KEY_PRESS|libtcod.EVENT_MOUSE,key,mouse)
+        with perf.stats.phase('render'):
+            render_all()
+        if rendering:
+            with perf.stats.phase('flush'):
+                libtcod.console_flush()
+
+        player_action = play_turn()
+        perf.stats.end_frame()
+        if player_action == 'exit':
+            break
+        if player_action != 'didnt-take-turn':
+            turns += 1
+    return turns
 
 def main_menu():
     img = libtcod.image_load('menu_background.png')
@@ -668,18 +962,27 @@ def main_menu():
         elif choice == 1:  # load last game
             try:
                 load_game()
-            except:
+            except (IOError, OSError):
                 msgbox('\n No saved game to load.\n', 24)
+            except savefile.SaveFormatError as e:
+                msgbox('\n Cannot load the saved game: ' + str(e) + '\n', 50)
             else:
                 play_game()
         elif choice == 2:  # quit
             break
 
 
-if __name__ == "__main__":
+def init_root():
+    # open the window (or the in-memory root console, with the headless backend) and create the off-screen consoles
+    global con, panel
+
     libtcod.console_set_custom_font('arial12x12.png', libtcod.FONT_TYPE_GREYSCALE | libtcod.FONT_LAYOUT_TCOD)
     libtcod.console_init_root(SCREEN_WIDTH, SCREEN_HEIGHT, 'roguelike', False)
     libtcod.sys_set_fps(LIMIT_FPS)
     con = libtcod.console_new(MAP_WIDTH, MAP_HEIGHT)
     panel = libtcod.console_new(SCREEN_WIDTH, PANEL_HEIGHT)
+
+
+if __name__ == "__main__":
+    init_root()
     main_menu()
@@ -0,0 +1,429 @@
+# the binary save file format. a file is:
+#   header    magic 'RLSV' and the format version, then the sizes of the two tables
+#   strings   every distinct string of the file (names, chars, messages...), utf-8 with a uint16 length in front
+#   colors    every distinct color of the file, as r, g, b bytes
+#   map       width, height, the decal clock, then the blocked, block_sight and explored planes packed
+#             8 tiles to a byte, then the decals
+#   entities  the objects of the level and the player's inventory, one typed record each
+#   game      indexes of the player and stairs, dungeon level, game state and the message log
+# integers are little-endian; records refer to strings and colors by their index in the tables.
+# components refer to their functions and AI classes by name, see FUNCTIONS and AI_CLASSES.
+# the layout of a version never changes once released: a new layout gets a new VERSION and its own reader
+# in READERS, and the readers of the older versions stay, each returning the game as the current one expects.
+import numbers
+import struct
+
+from backend import libtcod
+from levelmap import TileMap, DecalLayer, Decal, ObjectList
+from dynamics import (Fighter, BasicMonster, ConfusedMonster, BasicNPC, do_nothing, monster_death,
+    player_death, player_manaless)
+from statics import (Inventory, Item, Equipment, cast_heal, cast_mana, cast_lightning, cast_fireball,
+    cast_confuse)
+from messages import Messaging
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+MAGIC = b'RLSV'
+VERSION = 1
+
+# the functions components can refer to, by name
+FUNCTIONS = dict((f.__name__, f) for f in (do_nothing, monster_death, player_death, player_manaless,
+    cast_heal, cast_mana, cast_lightning, cast_fireball, cast_confuse))
+AI_CLASSES = dict((c.__name__, c) for c in (BasicMonster, ConfusedMonster, BasicNPC))
+
+# what an entity record holds, as bits of its flags byte
+HAS_FIGHTER, HAS_AI, HAS_ITEM, HAS_EQUIPMENT, BLOCKS, ALWAYS_VISIBLE, HAS_EXTRAS = [1 << i for i in range(7)]
+
+# the types an extra attribute (like player.level) can have, by their tag in the file
+EXTRA_INT, EXTRA_FLOAT, EXTRA_STRING, EXTRA_BOOL = range(4)
+
+
+class SaveFormatError(Exception):
+    pass
+
+
+def pack_bits(plane):
+    # a byte per tile (0 or 1) to a bit per tile
+    if numpy is not None:
+        return numpy.packbits(numpy.frombuffer(bytes(plane), dtype=numpy.uint8)).tobytes()
+    packed = bytearray((len(plane) + 7) // 8)
+    for i in range(len(plane)):
+        if plane[i]:
+            packed[i >> 3] |= 0x80 >> (i & 7)
+    return bytes(packed)
+
+
+def unpack_bits(data, n):
+    # a bit per tile back to a byte per tile
+    if numpy is not None:
+        return bytearray(numpy.unpackbits(numpy.frombuffer(data, dtype=numpy.uint8))[:n].tobytes())
+    data = bytearray(data)
+    plane = bytearray(n)
+    for i in range(n):
+        if data[i >> 3] & (0x80 >> (i & 7)):
+            plane[i] = 1
+    return plane
+
+
+# the fixed-size parts of the records
+PREFIX = struct.Struct('<4sH')  # magic, version: the same in every version
+TABLES = struct.Struct('<HH')  # number of strings, number of colors
+COLOR = struct.Struct('<BBB')
+MAP = struct.Struct('<HHiiI')  # width, height, decal clock, decal lifetime (-1 for none), number of decals
+DECAL = struct.Struct('<IHHHi')  # tile index, char, color, name, born
+ENTITY = struct.Struct('<BhhBdHHH')  # flags, x, y, layer, speed, char, name, color
+FIGHTER = struct.Struct('<iiiiiiiHH')  # hp, max hp, mp, max mp, defense, power, xp, death and manaless functions
+AI = struct.Struct('<Hi')  # class, turns left (ConfusedMonster, which is followed by the AI it replaced)
+EQUIPMENT = struct.Struct('<HiiiiB')  # slot, power, defense, max hp and max mp bonuses, equipped
+ITEM = struct.Struct('<H')  # use function
+EXTRAS = struct.Struct('<H')  # number of extra attributes, each an EXTRA followed by its value
+EXTRA = struct.Struct('<HB')  # name, type tag
+EXTRA_VALUES = {EXTRA_INT: struct.Struct('<q'), EXTRA_FLOAT: struct.Struct('<d'), EXTRA_STRING: struct.Struct('<H'),
+    EXTRA_BOOL: struct.Struct('<B')}
+ENTRY = struct.Struct('<HH')  # inventory letter, count
+GAME = struct.Struct('<IIiHH')  # player index, stairs index, dungeon level, game state, number of messages
+MESSAGE = struct.Struct('<HH')  # text, color
+COUNT = struct.Struct('<I')
+LENGTH = struct.Struct('<H')  # of a string
+
+
+def text(data):
+    # bytes from the file as the native str
+    return data if str is bytes else data.decode('utf-8')
+
+
+class Writer(object):
+    # collects the records, putting the strings and colors they use in tables, as they come
+    def __init__(self):
+        self.parts = []
+        self.string_index = {}  # string -> its index in strings
+        self.strings = []
+        self.color_index = {}  # (r, g, b) -> its index in colors
+        self.colors = []
+
+    def pack(self, record, *values):
+        self.parts.append(record.pack(*values))
+
+    def raw(self, data):
+        self.parts.append(data)
+
+    def string(self, s):
+        if s not in self.string_index:
+            self.string_index[s] = len(self.strings)
+            self.strings.append(s if isinstance(s, bytes) else s.encode('utf-8'))
+        return self.string_index[s]
+
+    def color(self, color):
+        key = (color.r, color.g, color.b)
+        if key not in self.color_index:
+            self.color_index[key] = len(self.colors)
+            self.colors.append(key)
+        return self.color_index[key]
+
+    def getvalue(self):
+        # the tables go first, but are only complete once everything else is written
+        parts = [PREFIX.pack(MAGIC, VERSION), TABLES.pack(len(self.strings), len(self.colors))]
+        for s in self.strings:
+            parts.append(LENGTH.pack(len(s)))
+            parts.append(s)
+        parts.extend(COLOR.pack(*c) for c in self.colors)
+        return b''.join(parts + self.parts)
+
+
+class Reader(object):
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+        self.strings = []
+        self.colors = []
+
+    def need(self, n):
+        if self.pos + n > len(self.data):
+            raise SaveFormatError('The save file is truncated.')
+
+    def unpack(self, record):
+        self.need(record.size)
+        values = record.unpack_from(self.data, self.pos)
+        self.pos += record.size
+        return values
+
+    def raw(self, n):
+        self.need(n)
+        data = self.data[self.pos:self.pos + n]
+        self.pos += n
+        return data
+
+    def string(self, i):
+        if i >= len(self.strings):
+            raise SaveFormatError('Bad string index in the save file.')
+        return self.strings[i]
+
+    def color(self, i):
+        if i >= len(self.colors):
+            raise SaveFormatError('Bad color index in the save file.')
+        return self.colors[i]
+
+
+def write_map(w, level_map):
+    decals = level_map.decals
+    # oldest first, as they expire
+    current = [(i, decal) for (i, decal) in decals.added if decals.decals.get(i) is decal]
+    w.pack(MAP, level_map.width, level_map.height, decals.now, -1 if decals.lifetime is None else decals.lifetime,
+        len(current))
+    for plane in (level_map.blocked, level_map.block_sight, level_map.explored):
+        w.raw(pack_bits(plane))
+    for i, decal in current:
+        w.pack(DECAL, i, w.string(decal.char), w.color(decal.color), w.string(decal.name), decal.born)
+
+
+def read_map(r):
+    # the planes go straight into a new map, without touching tiles one by one
+    width, height, now, lifetime, decal_count = r.unpack(MAP)
+    n = width * height
+    size = (n + 7) // 8
+    level_map = TileMap(width, height)
+    level_map.blocked = unpack_bits(r.raw(size), n)
+    level_map.block_sight = unpack_bits(r.raw(size), n)
+    level_map.explored = unpack_bits(r.raw(size), n)
+
+    decals = level_map.decals = DecalLayer(width, None if lifetime < 0 else lifetime)
+    decals.now = now
+    for k in range(decal_count):
+        i, char, color, name, born = r.unpack(DECAL)
+        if i >= n:
+            raise SaveFormatError('Decal off the map in the save file.')
+        decal = Decal(r.string(char), r.color(color), r.string(name), born)
+        decals.decals[i] = decal
+        decals.added.append((i, decal))
+    return level_map
+
+
+def write_ai(w, ai):
+    if isinstance(ai, ConfusedMonster):
+        w.pack(AI, w.string(type(ai).__name__), ai.num_turns)
+        write_ai(w, ai.old_ai)
+    else:
+        w.pack(AI, w.string(type(ai).__name__), 0)
+
+
+def read_ai(r):
+    name, num_turns = r.unpack(AI)
+    name = r.string(name)
+    if name not in AI_CLASSES:
+        raise SaveFormatError('Unknown AI: ' + name)
+    if AI_CLASSES[name] is ConfusedMonster:
+        return ConfusedMonster(read_ai(r), num_turns)
+    return AI_CLASSES[name]()
+
+
+def function_name(f):
+    if f is None:
+        return ''
+    if FUNCTIONS.get(f.__name__) is not f:
+        raise SaveFormatError('Cannot save the function ' + repr(f))
+    return f.__name__
+
+
+def function(name):
+    if name and name not in FUNCTIONS:
+        raise SaveFormatError('Unknown function: ' + name)
+    return FUNCTIONS.get(name)
+
+
+def write_entity(w, obj):
+    flags = ((HAS_FIGHTER if obj.fighter else 0) | (HAS_AI if obj.ai else 0) |
+        (HAS_ITEM if obj.item else 0) | (HAS_EQUIPMENT if obj.equipment else 0) |
+        (BLOCKS if obj.blocks else 0) | (ALWAYS_VISIBLE if obj.always_visible else 0))
+    extras = getattr(obj, '__dict__', None)
+    if extras:
+        flags |= HAS_EXTRAS
+    w.pack(ENTITY, flags, obj.x, obj.y, obj.layer, obj.speed, w.string(obj.char), w.string(obj.name), w.color(obj.color))
+
+    if obj.fighter:
+        f = obj.fighter
+        w.pack(FIGHTER, f.hp, f.base_max_hp, f.mp, f.base_max_mp, f.base_defense, f.base_power, f.xp,
+            w.string(function_name(f.death_function)), w.string(function_name(f.manaless_function)))
+    if obj.ai:
+        write_ai(w, obj.ai)
+    if obj.equipment:
+        e = obj.equipment
+        w.pack(EQUIPMENT, w.string(e.slot), e.power_bonus, e.defense_bonus, e.max_hp_bonus, e.max_mp_bonus, e.is_equipped)
+    elif obj.item:
+        w.pack(ITEM, w.string(function_name(obj.item.use_function)))
+    if extras:
+        write_extras(w, extras)
+
+
+def write_extras(w, extras):
+    w.pack(EXTRAS, len(extras))
+    for name, value in sorted(extras.items()):
+        # bool first, it's also an int
+        if isinstance(value, bool):
+            w.pack(EXTRA, w.string(name), EXTRA_BOOL)
+            w.pack(EXTRA_VALUES[EXTRA_BOOL], value)
+        elif isinstance(value, numbers.Integral):
+            w.pack(EXTRA, w.string(name), EXTRA_INT)
+            w.pack(EXTRA_VALUES[EXTRA_INT], value)
+        elif isinstance(value, float):
+            w.pack(EXTRA, w.string(name), EXTRA_FLOAT)
+            w.pack(EXTRA_VALUES[EXTRA_FLOAT], value)
+        elif isinstance(value, (str, type(u''))):
+            w.pack(EXTRA, w.string(name), EXTRA_STRING)
+            w.pack(EXTRA_VALUES[EXTRA_STRING], w.string(value))
+        else:
+            raise SaveFormatError('Cannot save the attribute %s = %r' % (name, value))
+
+
+def read_extras(r, obj):
+    for k in range(r.unpack(EXTRAS)[0]):
+        name, kind = r.unpack(EXTRA)
+        if kind not in EXTRA_VALUES:
+            raise SaveFormatError('Unknown attribute type in the save file.')
+        value = r.unpack(EXTRA_VALUES[kind])[0]
+        if kind == EXTRA_STRING:
+            value = r.string(value)
+        elif kind == EXTRA_BOOL:
+            value = bool(value)
+        setattr(obj, r.string(name), value)
+
+
+def read_entity(r, object_class):
+    string = r.string
+    flags, x, y, layer, speed, char, name, color = r.unpack(ENTITY)
+
+    fighter = ai = item = equipment = None
+    if flags & HAS_FIGHTER:
+        hp, max_hp, mp, max_mp, defense, power, xp, death_function, manaless_function = r.unpack(FIGHTER)
+        fighter = Fighter(max_hp, max_mp, defense, power, xp, function(string(death_function)),
+            function(string(manaless_function)))
+        fighter.hp = hp
+        fighter.mp = mp
+    if flags & HAS_AI:
+        ai = read_ai(r)
+    if flags & HAS_EQUIPMENT:
+        slot, power_bonus, defense_bonus, max_hp_bonus, max_mp_bonus, is_equipped = r.unpack(EQUIPMENT)
+        equipment = Equipment(string(slot), power_bonus, defense_bonus, max_hp_bonus, max_mp_bonus)
+        equipment.is_equipped = bool(is_equipped)
+    elif flags & HAS_ITEM:
+        item = Item(function(string(r.unpack(ITEM)[0])))
+
+    obj = object_class(x, y, string(char), string(name), r.color(color), blocks=bool(flags & BLOCKS),
+        always_visible=bool(flags & ALWAYS_VISIBLE), fighter=fighter, ai=ai, item=item, equipment=equipment,
+        speed=speed, layer=layer)
+    if isinstance(ai, ConfusedMonster):
+        ai.old_ai.owner = obj
+    if flags & HAS_EXTRAS:
+        read_extras(r, obj)
+    return obj
+
+
+def dumps(level_map, objects, player, stairs, game_msgs, game_state, dungeon_level):
+    # the whole game as a save file's bytes
+    w = Writer()
+    write_map(w, level_map)
+
+    w.pack(COUNT, len(objects))
+    for obj in objects:
+        write_entity(w, obj)
+    inventory = player.inventory
+    w.pack(COUNT, len(inventory))
+    for obj in inventory:
+        w.pack(ENTRY, w.string(inventory.letter(obj)), inventory.count(obj))
+        write_entity(w, obj)
+
+    messages = game_msgs.tolist()
+    w.pack(GAME, objects.index(player), objects.index(stairs), dungeon_level, w.string(game_state), len(messages))
+    for (line, color) in messages:
+        w.pack(MESSAGE, w.string(line), w.color(color))
+    return w.getvalue()
+
+
+def read_tables(r):
+    string_count, color_count = r.unpack(TABLES)
+    for i in range(string_count):
+        r.strings.append(text(r.raw(r.unpack(LENGTH)[0])))
+    r.colors = [libtcod.Color(*r.unpack(COLOR)) for i in range(color_count)]
+
+
+def read_v1(r, object_class):
+    read_tables(r)
+    level_map = read_map(r)
+    objects = ObjectList([read_entity(r, object_class) for i in range(r.unpack(COUNT)[0])])
+    entries = []
+    for i in range(r.unpack(COUNT)[0]):
+        letter, count = r.unpack(ENTRY)
+        entries.append((r.string(letter), read_entity(r, object_class), count))
+
+    player_index, stairs_index, dungeon_level, game_state, message_count = r.unpack(GAME)
+    if player_index >= len(objects) or stairs_index >= len(objects):
+        raise SaveFormatError('Bad player or stairs in the save file.')
+    messages = []
+    for i in range(message_count):
+        line, color = r.unpack(MESSAGE)
+        messages.append((r.string(line), r.color(color)))
+
+    player = objects[player_index]
+    player.inventory = Inventory.from_entries(entries)
+    return {
+        'level_map': level_map,
+        'objects': objects,
+        'player': player,
+        'stairs': objects[stairs_index],
+        'game_msgs': Messaging(*messages),
+        'game_state': r.string(game_state),
+        'dungeon_level': dungeon_level,
+    }
+
+
+# version -> function(reader, object_class) reading the rest of a file of that version
+READERS = {1: read_v1}
+
+
+def loads(data, object_class):
+    # read a save file's bytes. returns a dict with level_map, objects, player, stairs, game_msgs, game_state
+    # and dungeon_level. object_class builds the objects (GameObject)
+    r, version = open_file(data)
+    if version not in READERS:
+        raise SaveFormatError('Save file version %d is not supported.' % version)
+    return READERS[version](r, object_class)
+
+
+def open_file(data):
+    # a reader past the prefix of a file's bytes, and the version the prefix gives
+    if len(data) < PREFIX.size or data[:len(MAGIC)] != MAGIC:
+        raise SaveFormatError('Not a save file.')
+    r = Reader(data)
+    magic, version = r.unpack(PREFIX)
+    if version > VERSION:
+        raise SaveFormatError('Save file version %d is newer than this game (%d).' % (version, VERSION))
+    return r, version
+
+
+def dumps_map(level_map):
+    # just a map, in the layout of the current version: the header and tables, then the map record
+    w = Writer()
+    write_map(w, level_map)
+    return w.getvalue()
+
+
+def loads_map(data):
+    # a map written by dumps_map
+    r, version = open_file(data)
+    if version != VERSION:
+        raise SaveFormatError('Map of version %d, only version %d is supported.' % (version, VERSION))
+    read_tables(r)
+    return read_map(r)
+
+
+def save(path, *game):
+    data = dumps(*game)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def load(path, object_class):
+    with open(path, 'rb') as f:
+        return loads(f.read(), object_class)
@@ -0,0 +1,125 @@
+import heapq
+from itertools import count
+
+CHUNK = 8  # size of the squares dormant actors are bucketed in, by position
+
+
+class Scheduler(object):
+    # the objects that act (monsters, NPCs), in a heap ordered by the time of their next action.
+    # the clock moves on by turn_time for every action of the player; an actor with speed s acts
+    # every turn_time / s, so speed 2 acts twice per player turn and speed 0.5 every other turn.
+    # with a wake_radius, actors whose AI does nothing out of sight (sleeps_out_of_sight) and that come up
+    # farther than that from the focus (the player) are parked in a dormant set instead of acting, until
+    # wake_around() is called near them: every turn around the player, or for a noise anywhere.
+    def __init__(self, turn_time=100, wake_radius=None):
+        self.turn_time = turn_time
+        self.wake_radius = wake_radius
+        self.focus = None
+        self.now = 0
+        self.queue = []
+        self.entries = {}  # actor -> its entry in the queue
+        self.sequence = count()  # breaks ties, so actors due at the same time act in the order they were added
+        self.dormant = {}  # (chunk x, chunk y) -> set of parked actors
+        self.dormant_chunk = {}  # parked actor -> its chunk
+
+    def __len__(self):
+        return len(self.entries) + len(self.dormant_chunk)
+
+    def __contains__(self, actor):
+        return actor in self.entries or actor in self.dormant_chunk
+
+    def delay(self, actor):
+        # time between two actions of an actor
+        speed = getattr(actor, 'speed', 1) or 1
+        return self.turn_time / float(speed)
+
+    def add(self, actor, delay=None):
+        # register an actor; it first acts after one delay (or the given one)
+        if actor in self:
+            return
+        if delay is None:
+            delay = self.delay(actor)
+        self._push(actor, self.now + delay)
+
+    def remove(self, actor):
+        # unregister an actor. its entry stays in the heap but is skipped when it comes up
+        entry = self.entries.pop(actor, None)
+        if entry is not None:
+            entry[2] = None
+        chunk = self.dormant_chunk.pop(actor, None)
+        if chunk is not None:
+            self._unpark(actor, chunk)
+
+    def _push(self, actor, time):
+        entry = [time, next(self.sequence), actor]
+        self.entries[actor] = entry
+        heapq.heappush(self.queue, entry)
+
+    def advance(self, time=None):
+        # move the clock on, by one turn unless told otherwise
+        self.now += self.turn_time if time is None else time
+
+    def activate(self, x, y):
+        # set the focus, and wake everything around it. call before due()
+        self.focus = (x, y)
+        if self.wake_radius is not None:
+            self.wake_around(x, y, self.wake_radius)
+
+    def wake_around(self, x, y, radius):
+        # wake the dormant actors within radius of (x, y). they act on the next due()
+        if not self.dormant:
+            return
+        radius_squared = radius * radius
+        woken = []
+        for cx in range((x - radius) // CHUNK, (x + radius) // CHUNK + 1):
+            for cy in range((y - radius) // CHUNK, (y + radius) // CHUNK + 1):
+                for actor in self.dormant.get((cx, cy), ()):
+                    if (actor.x - x) ** 2 + (actor.y - y) ** 2 <= radius_squared:
+                        woken.append(actor)
+        for actor in woken:
+            self.wake(actor)
+
+    def wake(self, actor):
+        chunk = self.dormant_chunk.pop(actor, None)
+        if chunk is None:
+            return
+        self._unpark(actor, chunk)
+        if actor.ai:  # it may have died while dormant
+            self._push(actor, self.now)
+
+    def _park(self, actor):
+        chunk = (actor.x // CHUNK, actor.y // CHUNK)
+        self.dormant_chunk[actor] = chunk
+        self.dormant.setdefault(chunk, set()).add(actor)
+
+    def _unpark(self, actor, chunk):
+        parked = self.dormant[chunk]
+        parked.discard(actor)
+        if not parked:
+            del self.dormant[chunk]
+
+    def is_dormant(self, actor):
+        # true if the actor would do nothing now: its AI only acts on sight, and it's out of reach of the focus
+        if self.wake_radius is None or self.focus is None or not getattr(actor.ai, 'sleeps_out_of_sight', False):
+            return False
+        x, y = self.focus
+        return (actor.x - x) ** 2 + (actor.y - y) ** 2 > self.wake_radius * self.wake_radius
+
+    def due(self):
+        # yields the actors whose next action is due, in time order, rescheduling each one as it comes up.
+        # actors that lost their AI (they died) are dropped instead, so a swapped AI like ConfusedMonster
+        # keeps its place, while a corpse is never looked at again. dormant actors are parked.
+        queue = self.queue
+        while queue and queue[0][0] <= self.now:
+            time, _, actor = heapq.heappop(queue)
+            if actor is None:
+                continue
+            if not actor.ai:
+                del self.entries[actor]
+                continue
+            if self.is_dormant(actor):
+                del self.entries[actor]
+                self._park(actor)
+                continue
+            self._push(actor, time + self.delay(actor))
+            yield actor
@@ -0,0 +1,121 @@
+# runs the game headless from a script of commands, as fast as it can go, and reports the turns per second.
+# the commands go through the same handle_keys and monster turns as a real game. usage:
+#   python simulate.py [--turns N] [--seed S] [--render] [--script FILE]
+# without a script, a random walk of N commands (moves, with the odd pick up, item use and descent) is played.
+from __future__ import print_function
+
+import argparse
+import os
+import random
+import time
+
+os.environ.setdefault('ROGUELIKE_BACKEND', 'headless')
+
+from backend import libtcod, HEADLESS
+import roguelike
+
+# command name -> key presses
+MOVES = {
+    'up': libtcod.KEY_UP,
+    'down': libtcod.KEY_DOWN,
+    'left': libtcod.KEY_LEFT,
+    'right': libtcod.KEY_RIGHT,
+}
+
+
+def queue_command(command):
+    # turn one command into queued input:
+    #   up, down, left, right   move or attack
+    #   pickup                  pick up an item
+    #   use:<letter>            use the inventory item with that letter
+    #   drop:<letter>           drop the inventory item with that letter
+    #   descend                 go down the stairs
+    #   click:<x>,<y>           left-click a tile (for targeted spells)
+    #   exit                    leave the game
+    if command in MOVES:
+        libtcod.push_key(MOVES[command])
+    elif command == 'pickup':
+        libtcod.push_char('g')
+    elif command.startswith('use:'):
+        libtcod.push_char('i')
+        libtcod.push_char(command[4:])
+    elif command.startswith('drop:'):
+        libtcod.push_char('d')
+        libtcod.push_char(command[5:])
+    elif command == 'descend':
+        libtcod.push_char('<')
+    elif command.startswith('click:'):
+        x, y = command[6:].split(',')
+        libtcod.push_mouse(int(x), int(y), lbutton_pressed=True)
+    elif command == 'exit':
+        libtcod.push_key(libtcod.KEY_ESCAPE)
+    else:
+        raise ValueError('Unknown command: ' + repr(command))
+
+
+def random_commands(n, seed=None):
+    # a random walk, picking things up, drinking potions and taking the stairs now and then
+    rnd = random.Random(seed)
+    commands = []
+    for i in range(n):
+        roll = rnd.random()
+        if roll < 0.9:
+            commands.append(rnd.choice(sorted(MOVES)))
+        elif roll < 0.95:
+            commands.append('pickup')
+        elif roll < 0.98:
+            commands.append('use:' + rnd.choice('abc'))
+        else:
+            commands.append('descend')
+    return commands
+
+
+def simulate(commands, seed=None, render=False):
+    # play a new game with the given commands. returns a dict describing the run
+    if not HEADLESS:
+        raise RuntimeError('simulations need the headless backend (ROGUELIKE_BACKEND=headless)')
+    if seed is not None:
+        libtcod.random_set_seed(seed)
+    libtcod.events.clear()
+
+    roguelike.init_root()
+    roguelike.new_game()
+    for command in commands:
+        queue_command(command)
+
+    roguelike.rendering = render
+    start = time.time()
+    turns = roguelike.simulate_game()
+    elapsed = time.time() - start
+
+    return {
+        'commands': len(commands),
+        'turns': turns,
+        'seconds': elapsed,
+        'turns_per_second': turns / elapsed if elapsed > 0 else float('inf'),
+        'dungeon_level': roguelike.dungeon_level,
+        'game_state': roguelike.game_state,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the game headless from scripted input and report turns per second.')
+    parser.add_argument('--turns', type=int, default=1000, help='number of random commands to play (default 1000)')
+    parser.add_argument('--seed', type=int, default=None, help='seed for the dungeon and the random commands')
+    parser.add_argument('--render', action='store_true', help='draw every frame to the in-memory console')
+    parser.add_argument('--script', help='file with one command per line, instead of random ones')
+    args = parser.parse_args(argv)
+
+    if args.script:
+        with open(args.script) as f:
+            commands = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+    else:
+        commands = random_commands(args.turns, args.seed)
+
+    result = simulate(commands, args.seed, args.render)
+    print('%(turns)d turns in %(seconds).3f s: %(turns_per_second).1f turns/s '
+          '(dungeon level %(dungeon_level)d, %(game_state)s)' % result)
+
+
+if __name__ == '__main__':
+    main()
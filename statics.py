@@ -1,16 +1,128 @@
-import libtcodpy as libtcod
-from constants import CONFUSE_RANGE, HEAL_AMOUNT, LIGHTNING_RANGE, LIGHTNING_DAMAGE, MANABUFF_AMOUNT, FIREBALL_DAMAGE, FIREBALL_RADIUS
-from dynamics import ConfusedMonster
+import copy
+import string
+
+from backend import libtcod
+from constants import (CONFUSE_RANGE, HEAL_AMOUNT, LIGHTNING_RANGE, LIGHTNING_DAMAGE, MANABUFF_AMOUNT, FIREBALL_DAMAGE,
+    FIREBALL_RADIUS, LIGHTNING_NOISE_RADIUS, FIREBALL_NOISE_RADIUS)
+from dynamics import Fighter, ConfusedMonster
+
+
+LETTERS = string.ascii_lowercase  # one per inventory entry
+
+
+def stack_key(obj):
+    # identical consumables (same name and use, not equipment) stack together. None for the rest
+    if obj.item is None or obj.equipment is not None or obj.item.use_function is None:
+        return None
+    return (obj.name, obj.item.use_function)
+
+
+class Inventory(object):
+    # the items an object carries, each entry under its own letter, which it keeps until it's gone.
+    # identical consumables share one entry: the first of them is kept, with a count of how many there are,
+    # and the others are let go. equipped items are also indexed by slot.
+    def __init__(self, items=()):
+        self.items = {}  # letter -> item
+        self.letters = {}  # item -> its letter
+        self.counts = {}  # letter -> how many items the entry stands for
+        self.stacks = {}  # stack key -> letter
+        self.equipped = {}  # slot -> the Equipment in it
+        for obj in items:
+            self.append(obj)
+
+    @classmethod
+    def from_entries(cls, entries):
+        # an inventory holding the given (letter, item, count) entries, like a saved one
+        inventory = cls()
+        for letter, obj, count in entries:
+            inventory._add(obj, letter, count)
+        return inventory
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        # the entries, in letter order
+        items = self.items
+        return (items[letter] for letter in LETTERS if letter in items)
+
+    def __contains__(self, obj):
+        return obj in self.letters
+
+    def can_hold(self, obj):
+        # true if there's a free letter, or a stack to put obj on
+        return len(self.items) < len(LETTERS) or stack_key(obj) in self.stacks
+
+    def append(self, obj):
+        # add an item, on top of its stack if it has one. returns its letter
+        key = stack_key(obj)
+        if key is not None and key in self.stacks:
+            letter = self.stacks[key]
+            self.counts[letter] += 1
+            return letter
+        for letter in LETTERS:
+            if letter not in self.items:
+                self._add(obj, letter, 1)
+                return letter
+        raise ValueError('Inventory is full.')
+
+    def _add(self, obj, letter, count):
+        self.items[letter] = obj
+        self.letters[obj] = letter
+        self.counts[letter] = count
+        key = stack_key(obj)
+        if key is not None:
+            self.stacks[key] = letter
+        if obj.equipment and obj.equipment.is_equipped:
+            self.equipped[obj.equipment.slot] = obj.equipment
+            obj.equipment.inventory = self
+
+    def remove(self, obj):
+        # take one item off the entry of obj, freeing its letter when it was the last
+        if obj not in self.letters:
+            raise ValueError('Not in the inventory: ' + repr(obj))
+        letter = self.letters[obj]
+        self.counts[letter] -= 1
+        if self.counts[letter] == 0:
+            del self.items[letter]
+            del self.letters[obj]
+            del self.counts[letter]
+            key = stack_key(obj)
+            if key is not None:
+                del self.stacks[key]
+
+    def take(self, obj):
+        # remove one item of the entry of obj, and return it: obj itself if it was the last, otherwise a copy
+        if self.count(obj) == 1:
+            self.remove(obj)
+            return obj
+        self.remove(obj)
+        taken = copy.copy(obj)
+        taken.item = copy.copy(obj.item)
+        taken.item.owner = taken
+        return taken
+
+    def count(self, obj):
+        return self.counts[self.letters[obj]]
+
+    def letter(self, obj):
+        return self.letters.get(obj)
+
+    def get(self, letter):
+        # the item under a letter, or None
+        return self.items.get(letter)
 
 
 class Item(object):
     # an item that can be picked up and used.
+    __slots__ = ('owner', 'use_function')
+
     def __init__(self, use_function=None):
         self.use_function = use_function
 
     def pick_up(self, inventory, message, objects):
         # add to the player's inventory and remove from the map
-        if len(inventory) >= 26:
+        if not inventory.can_hold(self.owner):
             message('Your inventory is full, cannot pick up ' + self.owner.name + '.', libtcod.red)
         else:
             inventory.append(self.owner)
@@ -20,20 +132,20 @@ class Item(object):
         # special case: automatically equip, if the corresponding equipment slot is unused
             equipment = self.owner.equipment
             if equipment and get_equipped_in_slot(equipment.slot, inventory) is None:
-                equipment.equip(inventory)
+                equipment.equip(inventory, message)
 
     def drop(self, message, objects, player):
         # special case: if the object has the Equipment component, dequip it before dropping
         if self.owner.equipment:
             self.owner.equipment.dequip(message)
-        # add to the map and remove from the player's inventory. also, place it at the player's coordinates
-        objects.append(self.owner)
-        player.inventory.remove(self.owner)
-        self.owner.x = player.x
-        self.owner.y = player.y
-        message('You dropped a ' + self.owner.name + '.', libtcod.yellow)
-
-    def use(self, message, player, objects, target_monster, closest_monster, target_tile):
+        # remove it from the player's inventory (just one, if it's stacked), then place it at the player's coordinates
+        dropped = player.inventory.take(self.owner)
+        dropped.x = player.x
+        dropped.y = player.y
+        objects.append(dropped)
+        message('You dropped a ' + dropped.name + '.', libtcod.yellow)
+
+    def use(self, message, player, objects, target_monster, closest_monster, target_tile, noise):
         # special case: if the object has the Equipment component, the "use" action is to equip/dequip
         if self.owner.equipment:
             self.owner.equipment.toggle_equip(player, message)
@@ -42,11 +154,13 @@ class Item(object):
         if self.use_function is None:
             message('The ' + self.owner.name + ' cannot be used.')
         else:
-            if self.use_function(message, player, objects, target_monster, closest_monster, target_tile) != 'cancelled':
+            if self.use_function(message, player, objects, target_monster, closest_monster, target_tile, noise) != 'cancelled':
                 player.inventory.remove(self.owner)  # destroy after use, unless it was cancelled for some reason
 
 class Equipment(object):
     # an object that can be equipped, yielding bonuses. Automatically adds the Item component.
+    __slots__ = ('owner', 'power_bonus', 'defense_bonus', 'max_hp_bonus', 'max_mp_bonus', 'slot', 'is_equipped', 'inventory')
+
     def __init__(self, slot, power_bonus=0, defense_bonus=0, max_hp_bonus=0, max_mp_bonus=0):
         self.power_bonus = power_bonus
         self.defense_bonus = defense_bonus
@@ -55,6 +169,7 @@ class Equipment(object):
 
         self.slot = slot
         self.is_equipped = False
+        self.inventory = None  # the Inventory it's equipped in
 
     def toggle_equip(self, player, message):     # toggle equip/dequip status
         if self.is_equipped:
@@ -70,15 +185,22 @@ class Equipment(object):
 
         # equip object and show a message about it
         self.is_equipped = True
+        self.inventory = inventory
+        inventory.equipped[self.slot] = self
+        Fighter.equipment_changed()
         message('Equipped ' + self.owner.name + ' on ' + self.slot + '.', libtcod.light_green)
 
     def dequip(self, message):
         # dequip object and show a message about it
         if not self.is_equipped: return
         self.is_equipped = False
+        if self.inventory is not None and self.inventory.equipped.get(self.slot) is self:
+            del self.inventory.equipped[self.slot]
+        self.inventory = None
+        Fighter.equipment_changed()
         message('Dequipped ' + self.owner.name+ ' from ' + self.slot + '.', libtcod.light_yellow)
 
-def cast_confuse(message, player, objects, target_monster, closest_monster, target_tile):
+def cast_confuse(message, player, objects, target_monster, closest_monster, target_tile, noise):
     # ask the player for a target to confuse
     message('Left-click an enemy to confuse it, or right-click to cancel.', libtcod.light_cyan)
     monster = target_monster(CONFUSE_RANGE)
@@ -91,7 +213,7 @@ def cast_confuse(message, player, objects, target_monster, closest_monster, targ
     message('The eyes of the ' + monster.name + ' look vacant, as he starts to stumble around!', libtcod.light_green)
     player.fighter.manadecrease(8)
 
-def cast_heal(message, player, objects, target_monster, closest_monster, target_tile):
+def cast_heal(message, player, objects, target_monster, closest_monster, target_tile, noise):
     # heal the player
     if player.fighter.hp == player.fighter.max_hp:
         message('You are already at full health.', libtcod.red)
@@ -101,7 +223,7 @@ def cast_heal(message, player, objects, target_monster, closest_monster, target_
     player.fighter.heal(HEAL_AMOUNT)
     player.fighter.manadecrease(1)
 
-def cast_mana(message, player, objects, target_monster, closest_monster, target_tile):
+def cast_mana(message, player, objects, target_monster, closest_monster, target_tile, noise):
     # restore the player's mana
     if player.fighter.mp == player.fighter.max_mp:
         message('You are already at full mana.', libtcod.red)
@@ -110,7 +232,7 @@ def cast_mana(message, player, objects, target_monster, closest_monster, target_
     message('Your magic feels a bit refreshed!', libtcod.light_violet)
     player.fighter.manabuff(MANABUFF_AMOUNT)
 
-def cast_lightning(message, player, objects, target_monster, closest_monster, target_tile):
+def cast_lightning(message, player, objects, target_monster, closest_monster, target_tile, noise):
     # find closest enemy (inside a maximum range) and damage it
     monster = closest_monster(LIGHTNING_RANGE)
     if monster is None:  # no enemy found within maximum range
@@ -120,27 +242,26 @@ def cast_lightning(message, player, objects, target_monster, closest_monster, ta
     # zap it!
     message('A lighting bolt strikes the ' + monster.name + ' with a loud thunder! The damage is '
         + str(LIGHTNING_DAMAGE) + ' hit points.', libtcod.light_blue)
-    monster.fighter.take_damage(LIGHTNING_DAMAGE)
+    noise(monster.x, monster.y, LIGHTNING_NOISE_RADIUS)
+    monster.fighter.take_damage(LIGHTNING_DAMAGE, message, player)
     player.fighter.manadecrease(3)
 
-def cast_fireball(message, player, objects, target_monster, closest_monster, target_tile):
+def cast_fireball(message, player, objects, target_monster, closest_monster, target_tile, noise):
     # ask the player for a target tile to throw a fireball at
     message('Left-click a target tile for the fireball, or right-click to cancel.', libtcod.light_cyan)
     (x, y) = target_tile()
     if x is None: return 'cancelled'
     message('The fireball explodes, burning everything within ' + str(FIREBALL_RADIUS) + ' tiles!', libtcod.orange)
+    noise(x, y, FIREBALL_NOISE_RADIUS)
 
-    for obj in objects:  # damage every fighter in range, including the player
+    for obj in objects.having('fighter'):  # damage every fighter in range, including the player
         if obj.distance(x, y) <= FIREBALL_RADIUS and obj.fighter:
             message('The ' + obj.name + ' gets burned for ' + str(FIREBALL_DAMAGE) + ' hit points.', libtcod.orange)
-            obj.fighter.take_damage(FIREBALL_DAMAGE)
+            obj.fighter.take_damage(FIREBALL_DAMAGE, message, player)
     player.fighter.manadecrease(5)
 
 def get_equipped_in_slot(slot, inventory): # returns the item in a slot, or None if it's empty
-    for obj in inventory:
-        if obj.equipment and obj.equipment.slot == slot and obj.equipment.is_equipped:
-            return obj.equipment
-    return None
+    return inventory.equipped.get(slot)
 
 
 def make_item(choice):
@@ -0,0 +1,94 @@
+# shadowcasting and the FOV cache on small hand-built maps. run with: python -m unittest test_fov
+import unittest
+
+from levelmap import TileMap
+from fov import FovCache, ShadowcastFov, compute_fov
+
+# two rooms split by a wall, the viewer stands in the left one
+TWO_ROOMS = [
+    '#########',
+    '#...#...#',
+    '#...#...#',
+    '#...#...#',
+    '#########',
+]
+
+
+def make_map(rows):
+    # '#' is a wall, anything else is floor
+    level_map = TileMap(len(rows[0]), len(rows), blocked=False)
+    for y, row in enumerate(rows):
+        for x, char in enumerate(row):
+            if char == '#':
+                level_map.blocked[x + y * level_map.width] = 1
+                level_map.block_sight[x + y * level_map.width] = 1
+    level_map.touch()
+    return level_map
+
+
+def lit(level_map, visible):
+    return set((i % level_map.width, i // level_map.width) for i in range(len(visible)) if visible[i])
+
+
+class ShadowcastTest(unittest.TestCase):
+    def test_walls_hide_what_is_behind_them(self):
+        level_map = make_map(TWO_ROOMS)
+        seen = lit(level_map, compute_fov(level_map, 2, 2))
+        self.assertIn((3, 2), seen)
+        self.assertIn((4, 2), seen)
+        self.assertEqual([(x, y) for x, y in seen if x > 4], [])
+
+    def test_light_walls(self):
+        level_map = make_map(TWO_ROOMS)
+        with_walls = lit(level_map, compute_fov(level_map, 2, 2, light_walls=True))
+        floor_only = lit(level_map, compute_fov(level_map, 2, 2, light_walls=False))
+        walls = set((x, y) for x, y in with_walls if level_map.block_sight[x + y * level_map.width])
+        self.assertIn((4, 2), walls)
+        self.assertIn((0, 0), walls)
+        self.assertEqual(floor_only, with_walls - walls)
+
+    def test_radius_edge(self):
+        level_map = make_map(['.' * 11] * 11)
+        seen = lit(level_map, compute_fov(level_map, 5, 5, radius=3))
+        for cell in ((8, 5), (2, 5), (5, 8), (5, 2), (7, 7)):
+            self.assertIn(cell, seen)
+        for cell in ((9, 5), (5, 9), (8, 6), (8, 8)):
+            self.assertNotIn(cell, seen)
+        self.assertEqual(seen, set((x, y) for x in range(11) for y in range(11) if (x - 5) ** 2 + (y - 5) ** 2 <= 9))
+
+    def test_no_radius_means_unlimited(self):
+        level_map = make_map(['.' * 11] * 11)
+        self.assertEqual(len(lit(level_map, compute_fov(level_map, 0, 0))), 11 * 11)
+
+
+class CacheTest(unittest.TestCase):
+    def test_masks_are_reused_until_the_map_is_touched(self):
+        level_map = make_map(TWO_ROOMS)
+        fov_map = ShadowcastFov(level_map)
+        first = fov_map.compute(2, 2)
+        self.assertIs(fov_map.compute(2, 2), first)
+        self.assertTrue(fov_map.is_in_fov(3, 2))
+
+        # wall off the viewer's right, writing the plane directly
+        level_map.block_sight[3 + 2 * level_map.width] = 1
+        self.assertIs(fov_map.compute(2, 2), first)
+        level_map.touch()
+        second = fov_map.compute(2, 2)
+        self.assertIsNot(second, first)
+        self.assertTrue(fov_map.is_in_fov(3, 2))
+        self.assertFalse(fov_map.is_in_fov(4, 2))
+        self.assertEqual(second, compute_fov(level_map, 2, 2))
+
+    def test_least_recently_used_mask_is_dropped(self):
+        cache = FovCache(2)
+        cache.put('a', bytearray(1))
+        cache.put('b', bytearray(1))
+        cache.get('a')
+        cache.put('c', bytearray(1))
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNotNone(cache.get('a'))
+        self.assertIsNotNone(cache.get('c'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,150 @@
+# flow fields and A* paths on small hand-built maps. run with: python -m unittest test_pathing
+import os
+import unittest
+
+os.environ.setdefault('ROGUELIKE_BACKEND', 'headless')
+
+from constants import FLOW_FIELD_RANGE
+from levelmap import TileMap
+from pathing import DistanceMap, Pathfinder, UNREACHED, astar, cost_map
+
+# a wall between the left and right halves, with a gap in the bottom row
+WALL_WITH_GAP = [
+    '...#...',
+    '...#...',
+    '...#...',
+    '.......',
+]
+
+
+def make_map(rows):
+    # '#' is a wall, anything else is floor
+    level_map = TileMap(len(rows[0]), len(rows), blocked=False)
+    for y, row in enumerate(rows):
+        for x, char in enumerate(row):
+            if char == '#':
+                level_map.blocked[x + y * level_map.width] = 1
+                level_map.block_sight[x + y * level_map.width] = 1
+    level_map.touch()
+    return level_map
+
+
+class Walker(object):
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+
+class RoutingTest(unittest.TestCase):
+    def assert_walkable(self, level_map, start, path):
+        for (x, y), (nx, ny) in zip([start] + path, path):
+            self.assertEqual(max(abs(nx - x), abs(ny - y)), 1)
+            self.assertFalse(level_map.blocked[nx + ny * level_map.width])
+
+    def test_astar_goes_through_the_gap(self):
+        level_map = make_map(WALL_WITH_GAP)
+        path = astar(cost_map(level_map), level_map.width, level_map.height, (1, 1), (5, 1))
+        self.assertEqual(len(path), 4)
+        self.assertEqual(path[-1], (5, 1))
+        self.assertIn((3, 3), path)
+        self.assert_walkable(level_map, (1, 1), path)
+
+    def test_astar_without_a_way_through(self):
+        level_map = make_map(['...#...'] * 4)
+        self.assertIsNone(astar(cost_map(level_map), level_map.width, level_map.height, (1, 1), (5, 1)))
+
+    def test_astar_may_end_on_a_blocked_goal(self):
+        level_map = make_map(WALL_WITH_GAP)
+        self.assertEqual(astar(cost_map(level_map), level_map.width, level_map.height, (2, 1), (3, 1)), [(3, 1)])
+
+    def test_distance_map_goes_through_the_gap(self):
+        level_map = make_map(WALL_WITH_GAP)
+        distances = DistanceMap(level_map)
+        distances.update(5, 1)
+        self.assertEqual(distances.at(1, 1), 4)
+        self.assertEqual(distances.at(3, 0), UNREACHED)
+
+        x, y = 1, 1
+        path = []
+        while (x, y) != (5, 1):
+            dx, dy = distances.step(x, y, lambda x, y: False)
+            x += dx
+            y += dy
+            path.append((x, y))
+        self.assertEqual(len(path), 4)
+        self.assert_walkable(level_map, (1, 1), path)
+
+    def test_distance_map_is_refilled_when_the_terrain_changes(self):
+        level_map = make_map(WALL_WITH_GAP)
+        distances = DistanceMap(level_map)
+        distances.update(5, 1)
+        self.assertEqual(distances.at(2, 1), 4)
+        level_map.tunnel(3, 1)  # tunnel() touches the map
+        distances.update(5, 1)
+        self.assertEqual(distances.at(2, 1), 3)
+
+
+class RangeTest(unittest.TestCase):
+    def test_fill_stops_at_the_limit(self):
+        level_map = make_map(['.' * 10])
+        distances = DistanceMap(level_map, 3)
+        distances.update(0, 0)
+        self.assertEqual([distances.at(x, 0) for x in range(6)], [0, 1, 2, 3, UNREACHED, UNREACHED])
+
+    def test_flow_field_range(self):
+        level_map = make_map(['.' * (FLOW_FIELD_RANGE + 5)])
+        distances = DistanceMap(level_map, FLOW_FIELD_RANGE)
+        distances.update(0, 0)
+        self.assertEqual(distances.at(FLOW_FIELD_RANGE, 0), FLOW_FIELD_RANGE)
+        self.assertEqual(distances.at(FLOW_FIELD_RANGE + 1, 0), UNREACHED)
+        self.assertIsNone(distances.step(FLOW_FIELD_RANGE + 2, 0, lambda x, y: False))
+
+
+class PathReuseTest(unittest.TestCase):
+    def setUp(self):
+        self.level_map = make_map(['.' * 10] * 5)
+        self.pathfinder = Pathfinder(self.level_map, tolerance=2)
+        self.walker = Walker(0, 2)
+
+    def walk(self, x, y):
+        # one step towards (x, y), returning the path it followed
+        step = self.pathfinder.next_step(self.walker, x, y)
+        self.walker.x, self.walker.y = step
+        return self.pathfinder.paths[self.walker]
+
+    def test_path_is_kept_while_the_target_stays_close(self):
+        path = self.walk(8, 2)
+        self.assertIs(self.walk(9, 3), path)
+        self.assertEqual(path[0], (8, 2))
+
+    def test_path_is_searched_again_when_the_target_moves_away(self):
+        path = self.walk(8, 2)
+        moved = self.walk(5, 2)
+        self.assertIsNot(moved, path)
+        self.assertEqual(moved[0], (5, 2))
+        self.assertEqual(moved[2][-1], (5, 2))
+
+    def test_path_is_searched_again_when_the_actor_strays(self):
+        path = self.walk(8, 2)
+        self.walker.x, self.walker.y = 4, 0
+        self.assertIsNot(self.walk(8, 2), path)
+
+    def test_terrain_changes_off_the_path_keep_it(self):
+        path = self.walk(8, 2)
+        self.level_map.tunnel(0, 0)
+        self.assertIs(self.walk(8, 2), path)
+        self.assertEqual(path[1], self.level_map.revision)
+
+    def test_terrain_blocking_the_path_replaces_it(self):
+        path = self.walk(8, 2)
+        ahead = path[2][1]
+        self.level_map.blocked[ahead[0] + ahead[1] * self.level_map.width] = 1
+        self.level_map.touch()
+        replaced = self.walk(8, 2)
+        self.assertIsNot(replaced, path)
+        self.assertNotIn(ahead, replaced[2])
+        self.assertEqual(replaced[2][-1], (8, 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,152 @@
+# round trips through the save file format. run with: python -m unittest test_savefile
+import os
+import unittest
+
+os.environ.setdefault('ROGUELIKE_BACKEND', 'headless')
+
+from backend import libtcod
+from levelmap import TileMap
+from dynamics import ConfusedMonster
+from statics import make_item
+import roguelike
+import savefile
+
+
+def new_game(seed=1):
+    libtcod.random_set_seed(seed)
+    roguelike.init_root()
+    roguelike.new_game()
+    return roguelike.player
+
+
+def dump_game():
+    return savefile.dumps(roguelike.level_map, roguelike.objects, roguelike.player, roguelike.stairs,
+        roguelike.game_msgs, roguelike.game_state, roguelike.dungeon_level)
+
+
+def describe(obj):
+    # what an object looks like to the game, as plain values
+    fighter = obj.fighter and (obj.fighter.hp, obj.fighter.max_hp, obj.fighter.mp, obj.fighter.power,
+        obj.fighter.defense, obj.fighter.xp, obj.fighter.death_function.__name__)
+    ai = obj.ai and (type(obj.ai).__name__, getattr(obj.ai, 'num_turns', None),
+        type(getattr(obj.ai, 'old_ai', None)).__name__)
+    item = obj.item and (obj.item.use_function and obj.item.use_function.__name__)
+    equipment = obj.equipment and (obj.equipment.slot, obj.equipment.power_bonus, obj.equipment.is_equipped)
+    return (obj.x, obj.y, obj.char, obj.name, (obj.color.r, obj.color.g, obj.color.b), obj.blocks, obj.layer,
+        obj.speed, fighter, ai, item, equipment)
+
+
+class DecalTest(unittest.TestCase):
+    def round_trip(self, level_map):
+        return savefile.loads_map(savefile.dumps_map(level_map))
+
+    def test_decals_expire_in_age_order_after_loading(self):
+        level_map = TileMap(10, 10)
+        decals = level_map.decals
+        decals.lifetime = 5
+        decals.add(9, 0, '%', libtcod.dark_red, 'old remains')  # born at 0, on a higher tile index
+        for i in range(3):
+            decals.tick()
+        decals.add(0, 0, '%', libtcod.dark_red, 'young remains')  # born at 3
+
+        loaded = self.round_trip(level_map).decals
+        for layer in (decals, loaded):
+            for i in range(3):
+                layer.tick()
+        self.assertEqual(sorted(d.name for x, y, d in decals.items()), ['young remains'])
+        self.assertEqual(sorted(d.name for x, y, d in loaded.items()), ['young remains'])
+
+    def test_replaced_decals_are_not_saved(self):
+        level_map = TileMap(10, 10)
+        level_map.decals.add(2, 3, '%', libtcod.dark_red, 'remains of orc')
+        level_map.decals.add(2, 3, '%', libtcod.dark_red, 'remains of troll')
+        loaded = self.round_trip(level_map).decals
+        self.assertEqual([(x, y, d.name) for x, y, d in loaded.items()], [(2, 3, 'remains of troll')])
+        self.assertEqual(len(loaded.added), 1)
+
+
+class GameTest(unittest.TestCase):
+    def setUp(self):
+        self.player = new_game()
+
+    def test_round_trip(self):
+        player = self.player
+        for kind in ('heal', 'heal', 'heal', 'sword', 'lightning'):
+            symbol, name, color, item, equipment = make_item(kind)
+            player.inventory.append(roguelike.GameObject(0, 0, symbol, name, color, item=item, equipment=equipment))
+        sword = [obj for obj in player.inventory if obj.equipment][0]
+        sword.equipment.equip(player.inventory, roguelike.game_msgs)
+        monster = roguelike.objects.having('ai')[0]
+        monster.ai = ConfusedMonster(monster.ai, 7)
+        monster.ai.owner = monster
+        roguelike.level_map.decals.add(3, 4, '%', libtcod.dark_red, 'remains of orc')
+        roguelike.level_map.explored[10:200] = bytearray(b'\x01') * 190
+
+        game = savefile.loads(dump_game(), roguelike.GameObject)
+        loaded = game['player']
+        self.assertEqual([describe(obj) for obj in game['objects']], [describe(obj) for obj in roguelike.objects])
+        self.assertEqual(game['objects'].index(loaded), roguelike.objects.index(player))
+        self.assertEqual(describe(game['stairs']), describe(roguelike.stairs))
+        self.assertEqual(loaded.level, player.level)
+        self.assertEqual([(loaded.inventory.letter(obj), loaded.inventory.count(obj), describe(obj)) for obj in loaded.inventory],
+            [(player.inventory.letter(obj), player.inventory.count(obj), describe(obj)) for obj in player.inventory])
+        self.assertEqual(list(loaded.inventory.equipped), ['right hand'])
+        self.assertIs(loaded.inventory.equipped['right hand'].inventory, loaded.inventory)
+        for name in ('blocked', 'block_sight', 'explored'):
+            self.assertEqual(getattr(game['level_map'], name), getattr(roguelike.level_map, name))
+        self.assertEqual([(x, y, d.name) for x, y, d in game['level_map'].decals.items()], [(3, 4, 'remains of orc')])
+        self.assertEqual([line for line, color in game['game_msgs'].tolist()],
+            [line for line, color in roguelike.game_msgs.tolist()])
+        self.assertEqual((game['game_state'], game['dungeon_level']), (roguelike.game_state, roguelike.dungeon_level))
+
+    def test_extras_that_cannot_be_saved(self):
+        self.player.notes = ['not', 'a', 'plain', 'value']
+        self.assertRaises(savefile.SaveFormatError, dump_game)
+
+    def test_truncated_files(self):
+        data = dump_game()
+        for size in range(0, len(data), 7):
+            self.assertRaises(savefile.SaveFormatError, savefile.loads, data[:size], roguelike.GameObject)
+
+    def test_not_a_save_file(self):
+        self.assertRaises(savefile.SaveFormatError, savefile.loads, b'GIF89a' + b'\0' * 100, roguelike.GameObject)
+
+
+class VersionTest(unittest.TestCase):
+    def setUp(self):
+        new_game()
+        self.data = dump_game()
+
+    def with_version(self, version):
+        return self.data[:4] + savefile.PREFIX.pack(savefile.MAGIC, version)[4:] + self.data[savefile.PREFIX.size:]
+
+    def test_current_version_has_a_reader(self):
+        self.assertIn(savefile.VERSION, savefile.READERS)
+        self.assertEqual(savefile.PREFIX.unpack_from(self.data)[1], savefile.VERSION)
+
+    def test_newer_version_is_refused(self):
+        self.assertRaises(savefile.SaveFormatError, savefile.loads, self.with_version(savefile.VERSION + 1),
+            roguelike.GameObject)
+
+    def test_unknown_older_version_is_refused(self):
+        self.assertRaises(savefile.SaveFormatError, savefile.loads, self.with_version(0), roguelike.GameObject)
+
+    def test_older_version_is_read_by_its_own_reader(self):
+        # the reader gets the file right after the version, whatever the layout of the rest
+        seen = []
+
+        def read_v0(r, object_class):
+            seen.append(r.raw(len(r.data) - r.pos))
+            return {'version': 0}
+
+        savefile.READERS[0] = read_v0
+        try:
+            game = savefile.loads(self.with_version(0), roguelike.GameObject)
+        finally:
+            del savefile.READERS[0]
+        self.assertEqual(game, {'version': 0})
+        self.assertEqual(seen, [self.data[savefile.PREFIX.size:]])
+
+
+if __name__ == '__main__':
+    unittest.main()